@@ -0,0 +1,242 @@
+import os
+
+import numpy as np
+
+# Above this many receipts the chart switches from one bar per receipt to binned views
+DEFAULT_MAX_BARS = 50
+# Stores shown in the per-store panel of a binned chart, largest first
+MAX_STORE_BARS = 20
+
+
+class TotalsTable:
+    """Receipt totals stored column-wise in growable NumPy arrays.
+
+    Each receipt has a total, a confidence (NaN if unknown), a day
+    (datetime64, NaT if unknown) and a store, stored as an integer code into
+    store_names (-1 if unknown). Appending is amortized O(1), and the grouped
+    statistics work on whole columns instead of Python lists.
+    """
+
+    def __init__(self, capacity=1024):
+        capacity = max(capacity, 1)
+        self._size = 0
+        self._totals = np.empty(capacity, np.float64)
+        self._confidence = np.empty(capacity, np.float32)
+        self._days = np.empty(capacity, 'datetime64[D]')
+        self._stores = np.empty(capacity, np.int32)
+        self.paths = []
+        self.store_names = []
+        self._store_codes = {}
+
+    @classmethod
+    def from_totals(cls, totals):
+        """Build a table from (image_path, total) pairs, as returned by process_receipts."""
+        totals = list(totals)
+        table = cls(len(totals))
+        for image_path, total in totals:
+            table.append(image_path, total)
+        return table
+
+    @classmethod
+    def from_records(cls, records):
+        """Build a table from cli records, skipping the ones that failed."""
+        table = cls()
+        for record in records:
+            if record['error'] is None:
+                table.add_record(record)
+        return table
+
+    def __len__(self):
+        return self._size
+
+    def _grow(self):
+        capacity = 2 * len(self._totals)
+        for name in ('_totals', '_confidence', '_days', '_stores'):
+            column = getattr(self, name)
+            grown = np.empty(capacity, column.dtype)
+            grown[:self._size] = column[:self._size]
+            setattr(self, name, grown)
+
+    def append(self, image_path, total, store=None, day=None, confidence=None):
+        """Add one receipt. day is an ISO date string, a date or None; an invalid date counts as unknown."""
+        if self._size == len(self._totals):
+            self._grow()
+        i = self._size
+        self._totals[i] = total
+        self._confidence[i] = np.nan if confidence is None else confidence
+        try:
+            self._days[i] = np.datetime64('NaT') if day is None else np.datetime64(day, 'D')
+        except ValueError:
+            self._days[i] = np.datetime64('NaT')
+        if store is None:
+            self._stores[i] = -1
+        else:
+            code = self._store_codes.get(store)
+            if code is None:
+                code = self._store_codes[store] = len(self.store_names)
+                self.store_names.append(store)
+            self._stores[i] = code
+        self.paths.append(image_path)
+        self._size += 1
+
+    def add_record(self, record):
+        """Add one cli record."""
+        self.append(record['path'], record['total'] or 0.0, store=record.get('store'), day=record.get('date'),
+                    confidence=record.get('confidence'))
+
+    @property
+    def totals(self):
+        return self._totals[:self._size]
+
+    @property
+    def confidence(self):
+        return self._confidence[:self._size]
+
+    @property
+    def days(self):
+        return self._days[:self._size]
+
+    @property
+    def stores(self):
+        return self._stores[:self._size]
+
+    def summary(self):
+        """Return count, sum, mean, median, p95, min and max of all totals."""
+        totals = self.totals
+        if not len(totals):
+            return {'count': 0, 'total': 0.0}
+        p50, p95 = np.percentile(totals, (50, 95))
+        return {
+            'count': len(totals),
+            'total': float(totals.sum()),
+            'mean': float(totals.mean()),
+            'median': float(p50),
+            'p95': float(p95),
+            'min': float(totals.min()),
+            'max': float(totals.max()),
+        }
+
+    def _grouped(self, codes, labels):
+        """Return {label: {'count', 'total', 'mean', 'min', 'max'}} for receipts grouped by code."""
+        known = codes >= 0
+        codes = codes[known]
+        totals = self.totals[known]
+        if not len(codes):
+            return {}
+
+        counts = np.bincount(codes, minlength=len(labels))
+        sums = np.bincount(codes, weights=totals, minlength=len(labels))
+
+        # Min and max per group over runs of equal codes, like the contour boxes in edge_detection
+        order = np.argsort(codes, kind='stable')
+        sorted_codes = codes[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_codes[1:] != sorted_codes[:-1])))
+        minimums = np.minimum.reduceat(totals[order], starts)
+        maximums = np.maximum.reduceat(totals[order], starts)
+
+        groups = {}
+        for code, minimum, maximum in zip(sorted_codes[starts], minimums, maximums):
+            groups[labels[code]] = {
+                'count': int(counts[code]),
+                'total': float(sums[code]),
+                'mean': float(sums[code] / counts[code]),
+                'min': float(minimum),
+                'max': float(maximum),
+            }
+        return groups
+
+    def by_store(self):
+        """Return grouped stats per store name, for receipts whose store is known."""
+        return self._grouped(self.stores, self.store_names)
+
+    def by_day(self):
+        """Return grouped stats per ISO day, in date order, for receipts whose date is known."""
+        days = self.days
+        known = ~np.isnat(days)
+        unique_days, inverse = np.unique(days[known], return_inverse=True)
+        codes = np.full(len(days), -1, np.intp)
+        codes[known] = inverse
+        return self._grouped(codes, [str(day) for day in unique_days])
+
+    def histogram(self, bins='auto'):
+        """Return (counts, edges) of the totals, with NumPy's automatic bin selection by default."""
+        return np.histogram(self.totals, bins=bins)
+
+
+def _plot_per_receipt(axes, table):
+    """One bar per receipt, for batches small enough to read."""
+    image_names = [path.split('/')[-1] for path in table.paths]
+    axes.bar(image_names, table.totals, color='skyblue')
+    axes.set_xlabel('Receipt Image')
+    axes.set_ylabel('Total Sales ($)')
+    axes.set_title('Total Sales from Receipts')
+    axes.tick_params(axis='x', labelrotation=45)
+    for label in axes.get_xticklabels():
+        label.set_horizontalalignment('right')
+
+
+def _plot_groups(axes, groups, max_bars, title):
+    """Bar chart of group totals, keeping the largest max_bars groups."""
+    top = sorted(groups.items(), key=lambda item: -item[1]['total'])[:max_bars]
+    axes.barh([name for name, _ in top][::-1], [stats['total'] for _, stats in top][::-1], color='skyblue')
+    axes.set_xlabel('Total Sales ($)')
+    axes.set_title(title if len(groups) <= max_bars else f"{title} (top {max_bars} of {len(groups)})")
+
+
+def _plot_days(axes, groups, max_bars):
+    """Daily totals as bars, or as a line when there are too many days for bars."""
+    days = np.array(list(groups), dtype='datetime64[D]')
+    totals = [stats['total'] for stats in groups.values()]
+    if len(days) <= max_bars:
+        axes.bar(days, totals, color='skyblue')
+    else:
+        axes.plot(days, totals, color='steelblue')
+    axes.set_ylabel('Total Sales ($)')
+    axes.set_title('Total Sales per Day')
+    axes.tick_params(axis='x', labelrotation=45)
+
+
+def plot_totals(figure, table, max_bars=DEFAULT_MAX_BARS, bins='auto'):
+    """Draw the totals on a matplotlib figure.
+
+    Small batches get one bar per receipt. Larger ones get a histogram of
+    totals plus, where known, the largest stores and the totals per day.
+    """
+    if len(table) <= max_bars:
+        _plot_per_receipt(figure.add_subplot(), table)
+        return figure
+
+    by_store = table.by_store()
+    by_day = table.by_day()
+    panels = 1 + bool(by_store) + bool(by_day)
+    axes = figure.subplots(panels, 1, squeeze=False)[:, 0]
+
+    counts, edges = table.histogram(bins)
+    axes[0].stairs(counts, edges, fill=True, color='skyblue')
+    summary = table.summary()
+    axes[0].set_xlabel('Total ($)')
+    axes[0].set_ylabel('Receipts')
+    axes[0].set_title(f"Totals of {summary['count']} receipts: sum {summary['total']:.2f}, "
+                      f"median {summary['median']:.2f}")
+
+    panel = 1
+    if by_store:
+        _plot_groups(axes[panel], by_store, min(max_bars, MAX_STORE_BARS), 'Total Sales per Store')
+        panel += 1
+    if by_day:
+        _plot_days(axes[panel], by_day, max_bars)
+    return figure
+
+
+def render_totals(table, output_path, max_bars=DEFAULT_MAX_BARS, bins='auto', dpi=100):
+    """Render the totals chart headlessly to a PNG or SVG file, picked by the file extension."""
+    # The Agg canvas needs no display, and avoids pyplot's global figure state
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    panels = 1 if len(table) <= max_bars else 3
+    figure = Figure(figsize=(10, 6 if panels == 1 else 12), layout='constrained')
+    FigureCanvasAgg(figure)
+    plot_totals(figure, table, max_bars=max_bars, bins=bins)
+    figure.savefig(output_path, dpi=dpi, format=os.path.splitext(output_path)[1][1:].lower() or 'png')
+    return output_path
@@ -0,0 +1,201 @@
+import math
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from ocr_functions import DEFAULT_CONFIG, extract_text_with_confidence
+from preprocessing import compile_operations, normalize_operation, operation_name
+
+# The histogram is taken on a copy whose longer side is at most this many pixels,
+# noise and stroke width on a full-resolution crop of at most this size
+STATS_SIZE = 512
+
+# Gray levels between the 2nd and 98th percentile below which contrast is boosted
+LOW_CONTRAST = 96
+# Estimated noise sigma above which the receipt is binarized to drop the background texture
+NOISY = 6.0
+# Stroke widths in pixels that get thickened or thinned before OCR
+THIN_STROKE = 2.0
+THICK_STROKE = 7.0
+# The chain unmatched images used before automatic selection
+DEFAULT_OPERATIONS = ('grayscale', 'binarization')
+
+# Laplacian-of-differences kernel for Immerkaer's fast noise estimate
+_NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], np.float32)
+
+
+class AutoOperations:
+    """Stands in for an operation list to have the chain chosen per receipt from image statistics.
+
+    With race=True up to max_candidates chains are OCRed in parallel and the
+    text with the highest Tesseract confidence is kept. Results arriving
+    after time_budget seconds are ignored, except for the statistics' own
+    pick, which is always waited for.
+    """
+
+    def __init__(self, race=False, max_candidates=3, time_budget=None):
+        self.race = race
+        self.max_candidates = max(1, max_candidates)
+        self.time_budget = time_budget
+
+    def __repr__(self):
+        if not self.race:
+            return 'auto'
+        return f"auto(race, max_candidates={self.max_candidates}, time_budget={self.time_budget})"
+
+
+def _center_crop(image, size):
+    """Return the central size x size (or smaller) crop of an image."""
+    height, width = image.shape[:2]
+    y = max(0, (height - size) // 2)
+    x = max(0, (width - size) // 2)
+    return image[y:y + size, x:x + size]
+
+
+def image_statistics(image):
+    """Compute cheap statistics of a warped receipt for choosing its preprocessing.
+
+    Returns a dict with 'mean' and 'contrast' (2nd to 98th percentile spread)
+    in gray levels, 'otsu_threshold', 'ink_threshold' (halfway between the
+    mean ink and paper levels on either side of Otsu's threshold),
+    'separability' (0 to 1, how cleanly Otsu's threshold splits ink from
+    paper), 'noise' (estimated sigma in gray levels) and 'stroke_width' in
+    pixels (None if no ink was found).
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    height, width = gray.shape
+    scale = min(1.0, STATS_SIZE / max(height, width))
+    small = gray if scale >= 1.0 else cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    histogram = cv2.calcHist([small], [0], None, [256], [0, 256]).ravel()
+    pixels = histogram.sum()
+    cdf = np.cumsum(histogram) / pixels
+    low, high = np.searchsorted(cdf, (0.02, 0.98))
+    levels = np.arange(256)
+    mean = float((histogram * levels).sum() / pixels)
+    variance = float((histogram * (levels - mean) ** 2).sum() / pixels)
+
+    # Otsu's threshold, and the share of the variance it explains
+    threshold, _ = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    dark = histogram[:int(threshold) + 1]
+    dark_weight = dark.sum() / pixels
+    separability = 0.0
+    ink_threshold = float(threshold)
+    if 0 < dark_weight < 1 and variance > 0:
+        dark_mean = (dark * levels[:len(dark)]).sum() / dark.sum()
+        light_mean = (mean - dark_weight * dark_mean) / (1 - dark_weight)
+        separability = float(dark_weight * (1 - dark_weight) * (dark_mean - light_mean) ** 2 / variance)
+        # Thin text is a small class, which pulls Otsu's threshold towards the paper
+        ink_threshold = float((dark_mean + light_mean) / 2)
+
+    # Noise and stroke width need full-resolution pixels, so they use a crop instead
+    crop = _center_crop(gray, STATS_SIZE)
+    noise = 0.0
+    if crop.shape[0] > 2 and crop.shape[1] > 2:
+        response = cv2.filter2D(crop.astype(np.float32), -1, _NOISE_KERNEL)[1:-1, 1:-1]
+        noise = float(math.sqrt(math.pi / 2) * np.abs(response).sum() / (6 * response.size))
+
+    # Twice the ink area over its boundary length approximates the width of thin strokes
+    ink = (crop <= threshold).astype(np.uint8)
+    boundary = int(np.count_nonzero(ink & ~cv2.erode(ink, np.ones((3, 3), np.uint8)).astype(bool)))
+    stroke_width = 2.0 * int(np.count_nonzero(ink)) / boundary if boundary else None
+
+    return {
+        'mean': mean,
+        'contrast': int(high - low),
+        'otsu_threshold': float(threshold),
+        'ink_threshold': ink_threshold,
+        'separability': separability,
+        'noise': noise,
+        'stroke_width': stroke_width,
+    }
+
+
+def select_operations(image, stats=None):
+    """Pick the preprocessing chain and binarization threshold for a receipt from its statistics.
+
+    Thin dark strokes are thickened with erosion and blotchy ones thinned
+    with dilation. Noisy scans are then binarized halfway between their ink
+    and paper levels, which drops the background texture; CLAHE would
+    amplify that noise first. Cleaner scans stay in grayscale for
+    Tesseract's own thresholding, with CLAHE at low contrast. Sharpening is
+    never picked: on unresampled crops it only adds ringing that Tesseract
+    misreads. No OCR is run.
+    """
+    if stats is None:
+        stats = image_statistics(image)
+
+    operations = ['grayscale']
+    noisy = stats['noise'] >= NOISY
+    if not noisy:
+        if stats['contrast'] < LOW_CONTRAST:
+            operations.append(('clahe', {'clip_limit': 2.0}))
+
+    stroke_width = stats['stroke_width']
+    if stroke_width is not None and stroke_width < THIN_STROKE:
+        # The text is dark on the gray image, so erosion is what thickens it
+        operations.append('erosion')
+    elif stroke_width is not None and stroke_width > THICK_STROKE:
+        operations.append('dilation')
+
+    if noisy:
+        operations.append(('binarization', {'threshold_value': int(round(stats['ink_threshold']))}))
+    return tuple(map(normalize_operation, operations))
+
+
+def candidate_operations(image, max_candidates=3, stats=None):
+    """Return up to max_candidates distinct chains to race, the statistics' pick first.
+
+    The alternatives flip the pick between grayscale and binarized output,
+    try the binarization threshold nudged either way, and end with the
+    fixed default chain.
+    """
+    if stats is None:
+        stats = image_statistics(image)
+    selected = select_operations(image, stats)
+    names = [operation_name(operation) for operation in selected]
+    candidates = [selected]
+
+    threshold = int(round(stats['ink_threshold']))
+    if 'binarization' in names:
+        threshold = dict(selected[-1][1])['threshold_value']
+        kept = selected[:-1]
+        candidates.append(kept)
+    else:
+        kept = tuple(operation for operation in selected if operation_name(operation) != 'clahe')
+        candidates.append(kept + (('binarization', (('threshold_value', threshold),)),))
+    for offset in (-20, 20):
+        candidates.append(kept + (('binarization', (('threshold_value', threshold + offset),)),))
+    candidates.append(DEFAULT_OPERATIONS)
+
+    unique = []
+    for candidate in candidates:
+        if candidate not in unique:
+            unique.append(candidate)
+    return unique[:max_candidates]
+
+
+def race_operations(image, candidates, lang='eng', config=DEFAULT_CONFIG, time_budget=None, backend=None):
+    """Preprocess and OCR the candidate chains in parallel and keep the most confident result.
+
+    Returns (operations, text, confidence). Candidates still running after
+    time_budget seconds are abandoned, but the first candidate is always
+    waited for so there is a result.
+    """
+    def run(operations):
+        prepared = compile_operations(operations).run(image, copy=True)
+        text, confidence = extract_text_with_confidence(prepared, lang=lang, config=config, backend=backend)
+        return operations, text, confidence
+
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    try:
+        futures = [executor.submit(run, operations) for operations in candidates]
+        wait(futures, timeout=time_budget)
+        # The statistics' pick is the fallback, so it always gets to finish
+        futures[0].result()
+        finished = [future.result() for future in futures
+                    if future.done() and future.exception() is None]
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return max(finished, key=lambda result: result[2])
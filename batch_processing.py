@@ -0,0 +1,144 @@
+import os
+import sys
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from data_visualization import process_receipt
+from ocr_functions import set_ocr_workers
+
+
+def _process_one(image_path, cache=None, detection_scale=1.0, memory_limit=None):
+    """Process one receipt, turning any failure into an error message."""
+    try:
+        return process_receipt(image_path, cache=cache, detection_scale=detection_scale,
+                               memory_limit=memory_limit), None
+    except Exception as exc:
+        return 0.0, f"{type(exc).__name__}: {exc}"
+
+
+def _collect(future):
+    """Return (total, error) for a finished future, even if the worker died."""
+    try:
+        return future.result()
+    except Exception as exc:
+        return 0.0, f"{type(exc).__name__}: {exc}"
+
+
+def iter_process_receipts(image_paths, max_workers=None, use_threads=False, max_in_flight=None, ordered=True,
+                          cache=None, detection_scale=1.0, memory_limit=None, ocr_workers=1):
+    """Process receipts on a worker pool and yield (image_path, total, error) as they finish.
+
+    At most max_in_flight images are submitted at any time so memory stays flat.
+    With ordered=True results are yielded in input order, each one as soon as
+    it and every result before it are done; otherwise in completion order.
+    An ocr_cache.OCRCache passed as cache is shared by all workers, and
+    detection_scale and memory_limit are forwarded to process_receipt, so
+    memory_limit caps each worker's scan at that many bytes. Each worker
+    process gets an OCR pool of ocr_workers engines, so the processes do not
+    each load one engine per CPU; threads share the process's pool. A worker
+    process that dies fails only the image that killed it: the pool is
+    replaced and the other images it was running are submitted again.
+    """
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if max_in_flight is None:
+        max_in_flight = 2 * max_workers
+    max_in_flight = max(max_in_flight, 1)
+
+    def make_executor():
+        if use_threads:
+            return ThreadPoolExecutor(max_workers=max_workers)
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=set_ocr_workers, initargs=(ocr_workers,))
+
+    executor = make_executor()
+    image_paths = iter(image_paths)
+
+    try:
+        pending = {}     # future -> (index, image_path)
+        finished = {}    # index -> (image_path, total, error), waiting for earlier results
+        retry = deque()  # (index, image_path, alone) to submit again after a worker process died
+        alone = None     # future of a suspect that must run with nothing else in flight
+        next_index = 0
+        next_to_yield = 0
+        exhausted = False
+
+        while True:
+            # Keep the pool topped up without running ahead of max_in_flight
+            while alone not in pending:
+                if retry:
+                    if retry[0][2] and pending:
+                        break
+                    index, image_path, run_alone = retry.popleft()
+                elif exhausted or len(pending) + len(finished) >= max_in_flight:
+                    break
+                else:
+                    try:
+                        image_path = next(image_paths)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    index, run_alone = next_index, False
+                    next_index += 1
+                try:
+                    future = executor.submit(_process_one, image_path, cache, detection_scale, memory_limit)
+                except BrokenProcessPool:
+                    retry.appendleft((index, image_path, run_alone))
+                    if pending:
+                        # Replaced once the futures still on the dead pool are collected
+                        break
+                    executor.shutdown()
+                    executor = make_executor()
+                    continue
+                pending[future] = (index, image_path)
+                if run_alone:
+                    alone = future
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            crashed = [future for future in done if isinstance(future.exception(), BrokenProcessPool)]
+            if crashed:
+                # A worker died, which fails everything still on the pool; gather all of it
+                done, _ = wait(pending)
+                crashed = [future for future in done if isinstance(future.exception(), BrokenProcessPool)]
+                executor.shutdown()
+                executor = make_executor()
+
+            suspects = []
+            for future in done:
+                index, image_path = pending.pop(future)
+                if len(crashed) > 1 and future in crashed:
+                    # Any of these may have killed the worker; run each alone to find out which
+                    suspects.append((index, image_path, True))
+                    continue
+                total, error = _collect(future)
+                if ordered:
+                    finished[index] = (image_path, total, error)
+                else:
+                    yield image_path, total, error
+            retry.extendleft(sorted(suspects, reverse=True))
+
+            # Release every result whose predecessors are all done
+            while next_to_yield in finished:
+                yield finished.pop(next_to_yield)
+                next_to_yield += 1
+    finally:
+        executor.shutdown()
+
+
+def process_receipts_parallel(image_paths, max_workers=None, use_threads=False, max_in_flight=None, cache=None):
+    """Process multiple receipts in parallel and return (image_path, total, error) in input order."""
+    return list(iter_process_receipts(image_paths, max_workers=max_workers, use_threads=use_threads,
+                                      max_in_flight=max_in_flight, cache=cache))
+
+
+if __name__ == "__main__":
+    image_paths = sys.argv[1:]
+
+    for image_path, total, error in iter_process_receipts(image_paths):
+        if error:
+            print(f"{image_path}: failed ({error})")
+        else:
+            print(f"{image_path}: {total:.2f}")
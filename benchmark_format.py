@@ -0,0 +1,134 @@
+import argparse
+import re
+import time
+
+import numpy as np
+
+from format_output import format_text
+from synthetic_receipts import make_receipt_lines
+
+# Fragments OCR tends to produce around receipt text
+NOISE_TOKENS = ['-', '|', ' - ', '«', '.', ':', 'Tel: 0123', 'City Index', 'Lorem Ipsum', 'RESTAURANT', 'Total',
+                'Name  Qty   Total', '150', '1234', '12345', '7.5', '3.150', '1.500', 'x2', 'Sub Total', 'Change']
+
+
+def format_text_legacy(text):
+    """The previous regex-per-step formatter, kept as the reference output."""
+    text = re.sub(r'\s+', ' ', text.strip())
+
+    text = re.sub(r'\s*-\s*', ' - ', text)
+    text = re.sub(r'\s*\|\s*', ' | ', text)
+
+    text = re.sub(r'(RESTAURANT|Lorem Ipsum|City Index|Tel:|TAX INVOICE|CASH RECEIPT|BAKERY|Sub Total)', r'\n\1', text)
+
+    text = re.sub(r'(Name\s+Qty\s+Total)', r'\n\1\n', text)
+
+    def correct_price(match):
+        number = match.group()
+        if len(number) == 3 or len(number) == 4:
+            return f"{int(number) / 100:.2f}"
+        return number
+
+    text = re.sub(r'\b\d{3,4}\b(?!\.\d{2})', correct_price, text)
+
+    text = re.sub(r'(\d+\.\d{2})', r'\1\n', text)
+
+    lines = text.splitlines()
+    formatted_lines = []
+
+    for line in lines:
+        line = line.strip()
+
+        if re.search(r'\d+\.\d{2}', line):
+            parts = re.split(r'(\d+\.\d{2})', line)
+            item_part = parts[0].strip()
+            price_part = parts[1].strip()
+
+            item_match = re.match(r'(.+?)\s+(\d+)\s*$', item_part)
+            if item_match:
+                name = item_match.group(1).strip()
+                qty = item_match.group(2).strip()
+                formatted_lines.append(f"{name:<25} {qty:>3}  {price_part:>7}")
+            else:
+                formatted_lines.append(f"{item_part:<25}      {price_part:>7}")
+        else:
+            if re.match(r'(RESTAURANT|CASH RECEIPT|Sub Total|Cash|Change|BAKERY)', line):
+                formatted_lines.append(f"\n{line}")
+            else:
+                formatted_lines.append(line)
+
+    formatted_text = "\n".join(formatted_lines)
+    formatted_text = re.sub(r'(Sub Total)', r'\n\1', formatted_text)
+    formatted_text = re.sub(r'(Change\s+\d+\.\d{2})', r'\1\n\n', formatted_text)
+
+    return formatted_text
+
+
+def ocr_like_text(rng, lines):
+    """Join receipt lines the way OCR output looks: ragged spacing, lost decimal points, stray marks."""
+    words = []
+    for line in lines:
+        for word in line.split():
+            roll = rng.random()
+            if roll < 0.1 and re.fullmatch(r'\d+\.\d{2}', word):
+                word = word.replace('.', '')
+            elif roll < 0.15:
+                word = NOISE_TOKENS[rng.integers(len(NOISE_TOKENS))] + word
+            elif roll < 0.2:
+                word += NOISE_TOKENS[rng.integers(len(NOISE_TOKENS))]
+            words.append(word)
+        words.append('\n' * int(rng.integers(1, 3)))
+    separators = [' ', '  ', '\t', ' \n', '']
+    return ''.join(word + separators[rng.integers(len(separators))] for word in words)
+
+
+def make_corpus(count, seed):
+    """Build a regression corpus of OCR-like receipt texts with a fixed seed."""
+    rng = np.random.default_rng(seed)
+    corpus = ['', ' ', '\n\n', '150', 'Change 4.50', 'Sub Total', 'Name Qty Total150', '150RESTAURANT',
+              '3.150 1.500 12345.678', '--|-- a - | b', 'Cash\nChange\n']
+    for _ in range(count):
+        lines, _ = make_receipt_lines(rng, int(rng.integers(1, 10)))
+        corpus.append(ocr_like_text(rng, lines))
+    return corpus
+
+
+def time_formatter(function, corpus, repeat):
+    """Return the best time over repeat runs of the formatter over the whole corpus."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text in corpus:
+            function(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check format_text against the previous formatter and time both.")
+    parser.add_argument('--count', type=int, default=2000, help="synthetic receipts in the corpus")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('files', nargs='*', help="extra OCR text files to add to the corpus")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.count, args.seed)
+    for path in args.files:
+        with open(path, encoding='utf-8') as file:
+            corpus.append(file.read())
+
+    mismatches = [text for text in corpus if format_text(text) != format_text_legacy(text)]
+    print(f"{len(corpus)} texts, {len(mismatches)} mismatches")
+    for text in mismatches[:5]:
+        print(f"  {text!r}")
+
+    legacy = time_formatter(format_text_legacy, corpus, args.repeat)
+    current = time_formatter(format_text, corpus, args.repeat)
+    print(f"{'formatter':<10} {'total ms':>9} {'us/text':>9}")
+    for name, elapsed in (('legacy', legacy), ('current', current)):
+        print(f"{name:<10} {elapsed * 1000:>9.2f} {elapsed / len(corpus) * 1e6:>9.1f}")
+    print(f"speedup {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
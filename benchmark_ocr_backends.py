@@ -0,0 +1,78 @@
+import argparse
+import glob
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from ocr_functions import create_ocr_backend, extract_text_from_image
+
+
+def load_grayscale_images(image_paths):
+    """Load the benchmark images as grayscale arrays."""
+    images = []
+    for image_path in image_paths:
+        image = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            print(f"Warning: could not read {image_path}")
+            continue
+        images.append(image)
+    return images
+
+
+def time_backend(backend, images, repeat, concurrency):
+    """Return (latencies, wall_time) for OCR-ing every image repeat times."""
+    work = images * repeat
+    latencies = []
+
+    def run(image):
+        start = time.perf_counter()
+        extract_text_from_image(image, backend=backend)
+        latencies.append(time.perf_counter() - start)
+
+    # Warm-up call so one-off start-up cost is not counted as per-image latency
+    extract_text_from_image(images[0], backend=backend)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(run, work))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the pytesseract and worker-pool OCR backends.")
+    parser.add_argument('images', nargs='*', default=sorted(glob.glob('img/*.png')))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=None, help="worker count for the pool backend")
+    args = parser.parse_args()
+
+    images = load_grayscale_images(args.images)
+    if not images:
+        print("No images to benchmark.")
+        return
+
+    print(f"{len(images)} images x {args.repeat} repeats, concurrency {args.concurrency}\n")
+    print(f"{'backend':<12} {'mean ms':>9} {'p50 ms':>9} {'max ms':>9} {'images/s':>9}")
+
+    for name in ('pytesseract', 'pool'):
+        try:
+            kwargs = {'workers': args.workers or args.concurrency} if name == 'pool' else {}
+            backend = create_ocr_backend(name, **kwargs)
+            try:
+                latencies, wall_time = time_backend(backend, images, args.repeat, args.concurrency)
+            finally:
+                backend.close()
+        except Exception as exc:
+            print(f"{name:<12} unavailable ({type(exc).__name__}: {exc})")
+            continue
+
+        latencies.sort()
+        mean = sum(latencies) / len(latencies)
+        p50 = latencies[len(latencies) // 2]
+        print(f"{name:<12} {mean * 1000:>9.1f} {p50 * 1000:>9.1f} {latencies[-1] * 1000:>9.1f} "
+              f"{len(latencies) / wall_time:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
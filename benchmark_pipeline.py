@@ -0,0 +1,164 @@
+import argparse
+import difflib
+import json
+import time
+
+import numpy as np
+
+from data_visualization import receipt_total
+from format_output import format_receipt, parse_receipt
+from pipeline import detect_receipt_boxes, process_receipt_regions
+from autotune import AutoOperations
+from pipeline_config import get_operations_for_image
+from profiling import Profiler, stage
+from synthetic_receipts import BACKGROUNDS, render_sheet
+
+
+def box_iou(a, b):
+    """Return the intersection over union of two (x, y, w, h) boxes."""
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    intersection = max(0, x2 - x1) * max(0, y2 - y1)
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union else 0.0
+
+
+def match_regions(ground_truth, boxes, min_iou=0.5):
+    """Pair each ground-truth receipt with the index of its best detected box, or None."""
+    matches = []
+    used = set()
+    for receipt in ground_truth:
+        best, best_iou = None, min_iou
+        for i, box in enumerate(boxes):
+            iou = box_iou(receipt['box'], box)
+            if i not in used and iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            used.add(best)
+        matches.append(best)
+    return matches
+
+
+def text_similarity(expected, actual):
+    """Return a 0..1 similarity of two texts, ignoring blank lines and surrounding whitespace."""
+    def normalize(text):
+        return '\n'.join(line.strip() for line in text.splitlines() if line.strip())
+    return difflib.SequenceMatcher(None, normalize(expected), normalize(actual)).ratio()
+
+
+def run_sheet(sheet, ground_truth, operations, profiler, skip_ocr=False, detection_scale=1.0, max_workers=None,
+              line_ocr=False):
+    """Run the pipeline on one synthetic sheet and score it against the ground truth."""
+    metrics = profiler.start_image(f"sheet-{len(profiler.images)}")
+    start = time.perf_counter()
+
+    if skip_ocr:
+        boxes = detect_receipt_boxes(sheet, detection_scale=detection_scale, metrics=metrics)
+        regions = [{'box': box, 'text': None} for box in boxes]
+    else:
+        regions = process_receipt_regions(sheet, operations, max_workers=max_workers,
+                                          detection_scale=detection_scale, metrics=metrics, line_ocr=line_ocr)
+
+    results = []
+    for region in regions:
+        if region['text'] is None:
+            results.append({'box': region['box'], 'total': None, 'text': None})
+            continue
+        with stage(metrics, 'format'):
+            receipt = parse_receipt(region['text'])
+            format_receipt(receipt)
+        with stage(metrics, 'total'):
+            total = receipt_total(receipt, metrics)
+        results.append({'box': region['box'], 'total': total, 'text': region['text']})
+    elapsed = time.perf_counter() - start
+
+    matches = match_regions(ground_truth, [result['box'] for result in results])
+    scores = []
+    for receipt, index in zip(ground_truth, matches):
+        result = results[index] if index is not None else None
+        score = {'detected': result is not None}
+        if not skip_ocr:
+            score['total_correct'] = result is not None and result['total'] is not None and \
+                abs(result['total'] - receipt['total']) < 0.005
+            score['similarity'] = text_similarity(receipt['text'], result['text']) if result is not None else 0.0
+        scores.append(score)
+    return elapsed, len(results), scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the receipt pipeline on synthetic sheets with known "
+                                                 "text and totals.")
+    parser.add_argument('--sheets', type=int, default=10)
+    parser.add_argument('--receipts', type=int, default=3, help="receipts per sheet")
+    parser.add_argument('--scale', type=float, default=1.0, help="resolution multiplier")
+    parser.add_argument('--rotation', type=float, default=0.0, help="maximum rotation in degrees")
+    parser.add_argument('--noise', type=float, default=0.0, help="Gaussian noise sigma")
+    parser.add_argument('--background', choices=BACKGROUNDS, default='plain')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--operations', nargs='+', default=None,
+                        help="preprocessing operations, or 'auto' to choose them per receipt; defaults to "
+                             "the pipeline's default chain")
+    parser.add_argument('--race', type=float, default=None, metavar='SECONDS',
+                        help="with --operations auto, race candidate chains for up to SECONDS")
+    parser.add_argument('--detection-scale', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=None, help="threads per image for region OCR")
+    parser.add_argument('--line-ocr', action='store_true', help="OCR each receipt line by line")
+    parser.add_argument('--skip-ocr', action='store_true', help="only benchmark detection")
+    parser.add_argument('--json', default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    if args.operations == ['auto']:
+        operations = AutoOperations(race=args.race is not None, time_budget=args.race)
+    else:
+        operations = args.operations or get_operations_for_image(None)
+    profiler = Profiler()
+
+    # Render every sheet up front so generation is not part of the timings
+    sheets = [render_sheet(args.seed + i, args.receipts, args.scale, args.rotation, args.noise, args.background)
+              for i in range(args.sheets)]
+
+    latencies = []
+    detected_boxes = 0
+    scores = []
+    for sheet, ground_truth in sheets:
+        elapsed, boxes, sheet_scores = run_sheet(sheet, ground_truth, operations, profiler, args.skip_ocr,
+                                                 args.detection_scale, args.workers, args.line_ocr)
+        latencies.append(elapsed)
+        detected_boxes += boxes
+        scores.extend(sheet_scores)
+
+    latencies = np.asarray(latencies)
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    expected = len(scores)
+    results = {
+        'config': vars(args),
+        'sheet_shape': list(sheets[0][0].shape),
+        'images_per_second': len(latencies) / latencies.sum(),
+        'latency': {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)},
+        'receipts': expected,
+        'detected': sum(score['detected'] for score in scores),
+        'extra_boxes': detected_boxes - sum(score['detected'] for score in scores),
+        'stages': profiler.summary(),
+    }
+    if not args.skip_ocr:
+        results['total_accuracy'] = sum(score['total_correct'] for score in scores) / expected
+        results['text_similarity'] = float(np.mean([score['similarity'] for score in scores]))
+
+    print(f"sheets {args.sheets} of {results['sheet_shape'][1]}x{results['sheet_shape'][0]}, "
+          f"{expected} receipts, operations {operations}")
+    print(f"detected {results['detected']}/{expected} receipts, {results['extra_boxes']} extra boxes")
+    if not args.skip_ocr:
+        print(f"total accuracy {results['total_accuracy']:.1%}, mean text similarity "
+              f"{results['text_similarity']:.3f}")
+    print(f"{results['images_per_second']:.2f} images/s, latency p50 {p50 * 1000:.1f} ms, "
+          f"p95 {p95 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+    print()
+    print(profiler.report())
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
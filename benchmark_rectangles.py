@@ -0,0 +1,80 @@
+import argparse
+import random
+import time
+
+from edge_detection import combine_overlapping_rectangles
+
+
+def combine_overlapping_rectangles_single_pass(contours):
+    """The previous single-pass merge, kept for comparison: only merges with the running box."""
+    if not contours:
+        return []
+
+    contours = sorted(contours, key=lambda x: x[0])
+
+    combined_rectangles = []
+    current = contours[0]
+
+    for next_rect in contours[1:]:
+        x1, y1, w1, h1 = current
+        x2, y2, w2, h2 = next_rect
+
+        if x1 < x2 + w2 and x1 + w1 > x2 and y1 < y2 + h2 and y1 + h1 > y2:
+            new_x = min(x1, x2)
+            new_y = min(y1, y2)
+            new_w = max(x1 + w1, x2 + w2) - new_x
+            new_h = max(y1 + h1, y2 + h2) - new_y
+            current = (new_x, new_y, new_w, new_h)
+        else:
+            combined_rectangles.append(current)
+            current = next_rect
+
+    combined_rectangles.append(current)
+
+    return combined_rectangles
+
+
+def count_overlapping_pairs(rectangles):
+    """Count pairs of rectangles that still overlap after merging."""
+    count = 0
+    for i, (x1, y1, w1, h1) in enumerate(rectangles):
+        for x2, y2, w2, h2 in rectangles[i + 1:]:
+            if x1 < x2 + w2 and x1 + w1 > x2 and y1 < y2 + h2 and y1 + h1 > y2:
+                count += 1
+    return count
+
+
+def random_rectangles(count, width, height, max_size, seed):
+    """Generate candidate boxes like the ones noisy scan backgrounds produce."""
+    rng = random.Random(seed)
+    rectangles = []
+    for _ in range(count):
+        w = rng.randint(1, max_size)
+        h = rng.randint(1, max_size)
+        rectangles.append((rng.randint(0, width - w), rng.randint(0, height - h), w, h))
+    return rectangles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark rectangle merging against the old single-pass merge.")
+    parser.add_argument('--counts', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--width', type=int, default=5000)
+    parser.add_argument('--height', type=int, default=7000)
+    parser.add_argument('--max-size', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'boxes':>7} {'function':<12} {'ms':>9} {'merged':>8} {'overlaps left':>14}")
+    for count in args.counts:
+        rectangles = random_rectangles(count, args.width, args.height, args.max_size, args.seed)
+        for name, function in (('single-pass', combine_overlapping_rectangles_single_pass),
+                               ('sweep-line', combine_overlapping_rectangles)):
+            start = time.perf_counter()
+            merged = function(rectangles)
+            elapsed = time.perf_counter() - start
+            print(f"{count:>7} {name:<12} {elapsed * 1000:>9.2f} {len(merged):>8} "
+                  f"{count_overlapping_pairs(merged):>14}")
+
+
+if __name__ == "__main__":
+    main()
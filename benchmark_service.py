@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from service import DEFAULT_HOST, DEFAULT_PORT
+from synthetic_receipts import render_sheet
+
+
+async def post_image(reader, writer, host, data, query=''):
+    """POST one image to /receipts on an open keep-alive connection and return (status, payload)."""
+    writer.write(f"POST /receipts{query} HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/octet-stream\r\n"
+                 f"Content-Length: {len(data)}\r\n\r\n".encode('latin-1') + data)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def run_client(images, requests, open_connection, host, query, counter, results):
+    """Send images round-robin over one connection until the shared counter reaches requests."""
+    reader, writer = await open_connection()
+    try:
+        while counter[0] < requests:
+            index = counter[0]
+            counter[0] += 1
+            name, data = images[index % len(images)]
+            start = time.perf_counter()
+            try:
+                status, payload = await post_image(reader, writer, host, data, f"?name={name}{query}")
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # The server closed the connection; reconnect for the next request
+                results.append((time.perf_counter() - start, 0, None))
+                writer.close()
+                reader, writer = await open_connection()
+                continue
+            results.append((time.perf_counter() - start, status, payload))
+    finally:
+        writer.close()
+
+
+def load_images(paths, sheets, seed):
+    """Return (name, encoded bytes) pairs: the given files, or synthetic sheets encoded as PNG."""
+    if paths:
+        images = []
+        for path in paths:
+            with open(path, 'rb') as file:
+                images.append((os.path.basename(path), file.read()))
+        return images
+    images = []
+    for i in range(sheets):
+        sheet, _ = render_sheet(seed + i)
+        images.append((f"sheet-{i}.png", cv2.imencode('.png', sheet)[1].tobytes()))
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test a running receipt service and report throughput "
+                                                 "and latency.")
+    parser.add_argument('images', nargs='*', help="image files to send; defaults to synthetic sheets")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', default=None, metavar='PATH', help="connect to a Unix socket instead of TCP")
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=4, help="connections sending requests at once")
+    parser.add_argument('--deadline-ms', type=float, default=None, help="per-request deadline to ask for")
+    parser.add_argument('--line-ocr', action='store_true')
+    parser.add_argument('--sheets', type=int, default=4, help="synthetic sheets to cycle through")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    images = load_images(args.images, args.sheets, args.seed)
+    query = ''
+    if args.deadline_ms is not None:
+        query += f"&deadline_ms={args.deadline_ms:g}"
+    if args.line_ocr:
+        query += "&line_ocr=1"
+    if args.unix:
+        def open_connection():
+            return asyncio.open_unix_connection(args.unix)
+    else:
+        def open_connection():
+            return asyncio.open_connection(args.host, args.port)
+
+    async def run():
+        counter = [0]
+        results = []
+        start = time.perf_counter()
+        await asyncio.gather(*(run_client(images, args.requests, open_connection, args.host, query, counter, results)
+                               for _ in range(args.concurrency)))
+        return time.perf_counter() - start, results
+
+    elapsed, results = asyncio.run(run())
+
+    statuses = {}
+    for _, status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    ok = [(latency, payload) for latency, status, payload in results if status == 200]
+    latencies = np.asarray([latency for latency, _ in ok]) if ok else np.zeros(1)
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99))
+    queue_times = [payload['timings']['queue'] for _, payload in ok]
+    summary = {
+        'config': vars(args),
+        'requests': len(results),
+        'seconds': elapsed,
+        'requests_per_second': len(ok) / elapsed,
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=lambda item: item[0])},
+        'receipts': sum(len(payload['receipts']) for _, payload in ok),
+        'latency': {'p50': float(p50), 'p95': float(p95), 'p99': float(p99)},
+        'mean_queue': float(np.mean(queue_times)) if queue_times else None,
+    }
+
+    print(f"{len(results)} requests over {args.concurrency} connections in {elapsed:.2f} s, "
+          f"{summary['requests_per_second']:.2f} requests/s")
+    print(f"statuses {summary['statuses']}, {summary['receipts']} receipts")
+    print(f"latency p50 {p50 * 1000:.1f} ms, p95 {p95 * 1000:.1f} ms, p99 {p99 * 1000:.1f} ms")
+    if queue_times:
+        print(f"mean time queued in the service {summary['mean_queue'] * 1000:.1f} ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(summary, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+# Slow optional modules; the report shows which ones each entry point loads
+OPTIONAL_MODULES = ('matplotlib', 'pytesseract', 'tesserocr', 'PIL')
+
+# Run in a fresh interpreter: import the entry module, then optionally detect and OCR one image
+_CHILD = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+result = {{'import': imported - start, 'import_rss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}}
+if {image!r}:
+    import cv2
+    from pipeline import process_receipt_regions
+    from pipeline_config import get_operations_for_image
+    image = cv2.imread({image!r})
+    regions = process_receipt_regions(image, get_operations_for_image({image!r}))
+    result['first_result'] = time.perf_counter() - start
+    result['receipts'] = len(regions)
+result['rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+result['loaded'] = [name for name in {optional!r} if name in sys.modules]
+print(json.dumps(result))
+'''
+
+
+def run_child(module, image=None):
+    """Start a fresh interpreter, import module and optionally process image, returning its measurements."""
+    code = _CHILD.format(module=module, image=image or '', optional=OPTIONAL_MODULES)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def slowest_imports(module, top):
+    """Return the top (cumulative microseconds, module) pairs from python -X importtime for module."""
+    output = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], check=True,
+                            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stderr
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        # Only top-level modules, so a package is not listed again for each of its submodules
+        if '.' not in name:
+            entries.append((int(cumulative), name))
+    return sorted(entries, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the cold-start import time and RSS of the pipeline's "
+                                                 "entry points and of a first detect+OCR run.")
+    parser.add_argument('--modules', nargs='+', default=['pipeline', 'cli', 'service', 'data_visualization'])
+    parser.add_argument('--image', default='img/Recept-I.png', help="image for the detect+OCR run")
+    parser.add_argument('--repeat', type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument('--top', type=int, default=8, help="list this many of the slowest imports of cli")
+    parser.add_argument('--json', default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    runs = [(module, None) for module in args.modules] + [('pipeline', args.image)]
+    results = {}
+    print(f"{'entry point':<28} {'import ms':>10} {'first result ms':>16} {'peak RSS MB':>12}  optional modules loaded")
+    for module, image in runs:
+        samples = [run_child(module, image) for _ in range(args.repeat)]
+        label = module if image is None else f"{module} + detect/OCR"
+        summary = {
+            'import': float(np.median([sample['import'] for sample in samples])),
+            'rss': int(np.median([sample['rss'] for sample in samples])),
+            'loaded': samples[-1]['loaded'],
+        }
+        if image is not None:
+            summary['first_result'] = float(np.median([sample['first_result'] for sample in samples]))
+            summary['receipts'] = samples[-1]['receipts']
+        results[label] = summary
+
+        first = f"{summary['first_result'] * 1000:>16.1f}" if image is not None else f"{'-':>16}"
+        print(f"{label:<28} {summary['import'] * 1000:>10.1f} {first} {summary['rss'] / 1e6:>12.1f}  "
+              f"{', '.join(summary['loaded']) or '-'}")
+
+    if args.top:
+        print()
+        print("slowest imports of cli (cumulative ms):")
+        for cumulative, name in slowest_imports('cli', args.top):
+            print(f"  {name:<40} {cumulative / 1000:>8.1f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump({'config': vars(args), 'results': results}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
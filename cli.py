@@ -0,0 +1,218 @@
+import argparse
+import contextlib
+import csv
+import functools
+import json
+import sys
+import time
+
+import cv2
+
+from aggregation import TotalsTable, render_totals
+from data_visualization import receipt_total
+from format_output import format_receipt, parse_receipt
+from ingestion import iter_decoded_images, iter_image_paths
+from large_scans import load_scan
+from ocr_cache import get_default_cache
+from pipeline import process_receipt_regions, process_scan_regions
+from autotune import AutoOperations
+from pipeline_config import PipelineRegistry, get_default_registry, get_operations_for_image, set_default_registry
+from profiling import Profiler, stage
+
+STAGES = ('decode', 'load', 'detect', 'warp', 'preprocess', 'ocr', 'format', 'total')
+
+CSV_FIELDS = ['path', 'x', 'y', 'w', 'h', 'raw_text', 'formatted_text', 'store', 'date', 'total', 'confidence',
+              'diagnostics', 'error'] + \
+             [f'{name}_ms' for name in STAGES]
+
+
+class JsonLinesWriter:
+    """Write one JSON object per line, flushing after every record."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record) + '\n')
+        self.stream.flush()
+
+
+class CsvWriter:
+    """Write one CSV row per record, flushing after every row."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.writer = csv.DictWriter(stream, fieldnames=CSV_FIELDS)
+        self.writer.writeheader()
+        stream.flush()
+
+    def write(self, record):
+        box = record['box'] or (None, None, None, None)
+        row = {
+            'path': record['path'],
+            'x': box[0], 'y': box[1], 'w': box[2], 'h': box[3],
+            'raw_text': record['raw_text'],
+            'formatted_text': record['formatted_text'],
+            'store': record['store'],
+            'date': record['date'],
+            'total': record['total'],
+            'confidence': record['confidence'],
+            'diagnostics': ';'.join(diagnostic['code'] for diagnostic in record['diagnostics']),
+            'error': record['error'],
+        }
+        for name in STAGES:
+            seconds = record['timings'].get(name)
+            row[f'{name}_ms'] = None if seconds is None else round(seconds * 1000, 3)
+        self.writer.writerow(row)
+        self.stream.flush()
+
+
+def make_record(image_path, box=None, raw_text=None, formatted_text=None, total=None, error=None, timings=None,
+                confidence=None, diagnostics=None, store=None, date=None):
+    """Build the output record for one receipt."""
+    return {
+        'path': image_path,
+        'box': list(box) if box is not None else None,
+        'raw_text': raw_text,
+        'formatted_text': formatted_text,
+        'store': store,
+        'date': date,
+        'total': total,
+        'confidence': confidence,
+        'diagnostics': diagnostics or [],
+        'error': error,
+        'timings': timings or {},
+    }
+
+
+def iter_region_records(image_path, regions, decode_time=None, metrics=None):
+    """Parse and total the regions from pipeline.process_receipt_regions, yielding one record per region."""
+    for region in regions:
+        timings = {'decode': decode_time, **region['timings']} if decode_time is not None else dict(region['timings'])
+        # Parse once; the formatted text and the total both come from the same receipt model
+        start = time.perf_counter()
+        with stage(metrics, 'format'):
+            receipt = parse_receipt(region['text'])
+            formatted_text = format_receipt(receipt)
+        formatted = time.perf_counter()
+        with stage(metrics, 'total'):
+            total = receipt_total(receipt, metrics)
+        timings['format'] = formatted - start
+        timings['total'] = time.perf_counter() - formatted
+        yield make_record(image_path, region['box'], region['text'], formatted_text, total, timings=timings,
+                          confidence=receipt['confidence'], diagnostics=receipt['diagnostics'],
+                          store=receipt['store'], date=receipt['date'])
+
+
+def iter_records(sources, watch=False, cache=None, detection_scale=1.0, max_workers=None, max_queue=4,
+                 profiler=None, memory_limit=None, line_ocr=False):
+    """Run the pipeline headlessly and yield one record per detected receipt.
+
+    With memory_limit (bytes) images are loaded as large_scans.ScanImage,
+    detected at reduced resolution and cropped at full resolution; only one
+    scan is prefetched then, so the scans in flight stay near the limit. With
+    line_ocr=True each receipt's text lines are OCRed concurrently.
+    """
+    if memory_limit is None:
+        decode = cv2.imread
+    else:
+        decode = functools.partial(load_scan, memory_limit=memory_limit)
+        max_queue = 1
+
+    decode_start = time.perf_counter()
+    for image_path, image in iter_decoded_images(iter_image_paths(sources, watch=watch), max_queue=max_queue,
+                                                 decode=decode):
+        # Time spent waiting on the decoder, which is near zero while it keeps ahead of OCR
+        decode_time = time.perf_counter() - decode_start
+        metrics = profiler.start_image(image_path) if profiler is not None else None
+        if image is None:
+            yield make_record(image_path, error=f"Could not read image: {image_path}")
+            decode_start = time.perf_counter()
+            continue
+
+        try:
+            operations = get_operations_for_image(image_path)
+            if memory_limit is None:
+                regions = process_receipt_regions(image, operations, lang='eng', max_workers=max_workers,
+                                                  cache=cache, detection_scale=detection_scale, metrics=metrics,
+                                                  line_ocr=line_ocr)
+            else:
+                regions = process_scan_regions(image, operations, lang='eng', max_workers=max_workers, cache=cache,
+                                               metrics=metrics, line_ocr=line_ocr)
+        except Exception as exc:
+            yield make_record(image_path, error=f"{type(exc).__name__}: {exc}")
+            decode_start = time.perf_counter()
+            continue
+
+        if not regions:
+            yield make_record(image_path, error="No receipt detected", timings={'decode': decode_time})
+
+        yield from iter_region_records(image_path, regions, decode_time, metrics)
+
+        decode_start = time.perf_counter()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract receipts headlessly and write one record per receipt.")
+    parser.add_argument('sources', nargs='*', default=['-'],
+                        help="image files, directories, glob patterns, or '-' to read paths from stdin")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+    parser.add_argument('--output', '-o', default='-', help="output file, or '-' for stdout")
+    parser.add_argument('--watch', action='store_true', help="keep polling directories for new images")
+    parser.add_argument('--pipelines', default=None, help="JSON file of preprocessing pipeline rules")
+    parser.add_argument('--auto', action='store_true',
+                        help="choose preprocessing from image statistics for images no rule matches")
+    parser.add_argument('--race', type=float, default=None, metavar='SECONDS',
+                        help="with --auto, OCR candidate chains in parallel for up to SECONDS, keeping the best")
+    parser.add_argument('--detection-scale', type=float, default=1.0)
+    parser.add_argument('--max-memory', type=float, default=None, metavar='MB',
+                        help="large-scan mode: detect on a reduced decode and crop receipts at full resolution, "
+                             "keeping each scan within MB megabytes")
+    parser.add_argument('--line-ocr', action='store_true',
+                        help="split each receipt into text lines and OCR them concurrently")
+    parser.add_argument('--workers', type=int, default=None, help="threads per image for region OCR")
+    parser.add_argument('--cache', action='store_true', help="reuse OCR results from the on-disk cache")
+    parser.add_argument('--profile', action='store_true', help="print a per-stage timing report to stderr")
+    parser.add_argument('--profile-memory', action='store_true',
+                        help="also track allocations per stage; runs each image's regions on one thread")
+    parser.add_argument('--chart', default=None, help="also render a totals chart to this PNG or SVG file")
+    args = parser.parse_args(argv)
+
+    # Load and compile the pipelines before opening the output, so a bad config fails fast
+    if args.pipelines:
+        set_default_registry(PipelineRegistry.load(args.pipelines))
+    if args.auto:
+        get_default_registry().set_default(AutoOperations(race=args.race is not None, time_budget=args.race))
+
+    memory_limit = None if args.max_memory is None else int(args.max_memory * 1024 * 1024)
+    # tracemalloc's peak is process-wide, so concurrent regions would reset and count each other's allocations
+    max_workers = 1 if args.profile_memory else args.workers
+
+    stream = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        writer = JsonLinesWriter(stream) if args.format == 'jsonl' else CsvWriter(stream)
+        cache = get_default_cache() if args.cache else None
+        profiler = Profiler(track_memory=args.profile_memory) if args.profile or args.profile_memory else None
+        table = TotalsTable() if args.chart else None
+
+        # Keep stray pipeline messages out of the machine-readable output
+        with contextlib.redirect_stdout(sys.stderr):
+            for record in iter_records(args.sources, watch=args.watch, cache=cache,
+                                       detection_scale=args.detection_scale, max_workers=max_workers,
+                                       profiler=profiler, memory_limit=memory_limit, line_ocr=args.line_ocr):
+                writer.write(record)
+                if table is not None and record['error'] is None:
+                    table.add_record(record)
+
+        if table is not None:
+            render_totals(table, args.chart)
+
+        if profiler is not None:
+            print(profiler.report(), file=sys.stderr)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,18 @@
+import sys
 import cv2
-import re
-import matplotlib.pyplot as plt
-from grayscale import convert_to_grayscale
-from binarization import apply_binarization
-from morphological_operations import apply_dilation, apply_erosion
-from sharpening import apply_sharpening
-from edge_detection import (
-    apply_clahe,
-    apply_adaptive_threshold,
-    apply_morphology,
-    find_receipt_contours,
-    combine_overlapping_rectangles
+from aggregation import DEFAULT_MAX_BARS, TotalsTable, plot_totals, render_totals
+from transformation import get_perspective_transform
+from large_scans import load_scan
+from pipeline import (
+    detect_receipt_boxes,
+    detect_scan_boxes,
+    recognize_receipt,
+    process_receipt_regions,
+    process_scan_regions
 )
-from transformation import draw_transformed_receipts
-from ocr_functions import extract_text_from_image
-from format_output import print_formatted_text
+from pipeline_config import get_operations_for_image
+from format_output import parse_receipt, print_formatted_text
+from profiling import stage
 
 
 def load_image(image_path):
@@ -23,121 +21,173 @@ def load_image(image_path):
     return image
 
 
-def apply_edge_detection_and_transformation(image):
+def apply_edge_detection_and_transformation(image, detection_scale=1.0, metrics=None):
     """Apply edge detection and transformation to the image."""
-    # Step 1: Enhance contrast and apply adaptive thresholding
-    cl1 = apply_clahe(image)
-    binary_image = apply_adaptive_threshold(cl1)
-
-    # Step 2: Apply morphological operations
-    morphed_image = apply_morphology(binary_image)
-
-    # Step 3: Detect all contours that could be receipts, with a minimum height of 200 pixels
-    bounding_boxes = find_receipt_contours(morphed_image, min_height=200)
+    # Detect all receipts in the image, optionally on a downscaled copy
+    regions = detect_receipt_boxes(image, detection_scale=detection_scale, metrics=metrics, return_quads=True)
+
+    # Apply the perspective transformation to the first detected receipt for further processing
+    bounding_box, quad = regions[0]
+    with stage(metrics, 'warp'):
+        return get_perspective_transform(image, bounding_box, quad)
+
+
+def receipt_total(receipt, metrics=None):
+    """Return the total or subtotal of a receipt parsed by format_output.parse_receipt.
+
+    Returns 0.0 when none was found. The receipt's diagnostics are recorded
+    on metrics, if given, instead of being printed.
+    """
+    if metrics is not None:
+        metrics.add_diagnostics(receipt['diagnostics'])
+    return receipt['amount'] if receipt['amount'] is not None else 0.0
+
+
+def extract_total_or_subtotal(extracted_text, metrics=None):
+    """Extract the total or subtotal from the OCR text."""
+    return receipt_total(parse_receipt(extracted_text), metrics)
+
+def load_receipt_scan(image_path, memory_limit, metrics=None):
+    """Load a scan for detection within memory_limit bytes, see large_scans.load_scan."""
+    with stage(metrics, 'load'):
+        scan = load_scan(image_path, memory_limit)
+    if scan is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    return scan
+
+
+def process_receipt(image_path, cache=None, detection_scale=1.0, metrics=None, memory_limit=None, line_ocr=False):
+    """Process a single receipt and return its total or subtotal.
+
+    memory_limit (bytes) loads the scan through large_scans, ignoring detection_scale.
+    """
+    if memory_limit is not None:
+        scan = load_receipt_scan(image_path, memory_limit, metrics)
+        (x, y, w, h), quad = detect_scan_boxes(scan, metrics=metrics, return_quads=True)[0]
+        with stage(metrics, 'load'):
+            image = scan.crop_regions([(x, y, w, h)])[0]
+        if quad is not None:
+            with stage(metrics, 'warp'):
+                image = get_perspective_transform(image, (0, 0, w, h), quad - (x, y))
+        return process_warped_receipt(image, image_path, cache=cache, metrics=metrics, line_ocr=line_ocr)
+
+    with stage(metrics, 'load'):
+        image = load_image(image_path)
+    if image is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    return process_receipt_image(image, image_path, cache=cache, detection_scale=detection_scale, metrics=metrics,
+                                 line_ocr=line_ocr)
 
-    # Step 4: Combine overlapping rectangles
-    combined_boxes = combine_overlapping_rectangles(bounding_boxes)
 
-    # Step 5: Apply the perspective transformation to each detected receipt
-    transformed_receipts = draw_transformed_receipts(image, combined_boxes)
+def process_receipt_image(image, image_path, cache=None, detection_scale=1.0, metrics=None, line_ocr=False):
+    """Process an already decoded receipt image and return its total or subtotal."""
+    # Apply edge detection and transformation
+    image = apply_edge_detection_and_transformation(image, detection_scale=detection_scale, metrics=metrics)
+    return process_warped_receipt(image, image_path, cache=cache, metrics=metrics, line_ocr=line_ocr)
 
-    return transformed_receipts[0]  # Return the first transformed receipt for further processing
 
+def process_warped_receipt(image, image_path, cache=None, metrics=None, line_ocr=False):
+    """Preprocess and OCR a single warped receipt and return its total or subtotal."""
+    # Get operations based on the image path
+    operations = get_operations_for_image(image_path)
 
-def get_operations_for_image(image_path):
-    """Return the list of operations based on the image path."""
-    # Define the operations for specific image paths or patterns
-    operations_by_image = {
-        "images/Recept-I.png": ['grayscale', 'dilation', 'sharpening', 'erosion'],
-        "images/Recept-II.png": ['grayscale', 'sharpening', 'binarization'],
-        "images/Recept-III.png": ['grayscale', 'sharpening'],
-        "images/Recept-IV.png": ['grayscale', 'sharpening'],
-        "images/Recepts.png": ['grayscale', 'sharpening', 'binarization'],
-    }
+    # Execute specified operations in order and OCR the result
+    extracted_text = recognize_receipt(image, operations, lang='eng', cache=cache, metrics=metrics, line_ocr=line_ocr)
 
-    # Default operations if the image path doesn't match any specific case
-    default_operations = ['grayscale', 'binarization']
+    # Extract the total or subtotal from the text
+    with stage(metrics, 'total'):
+        return extract_total_or_subtotal(extracted_text, metrics)
 
-    # Return the operations based on the image path, or the default if not found
-    return operations_by_image.get(image_path, default_operations)
 
+def process_receipt_regions_in_image(image_path, max_workers=None, cache=None, detection_scale=1.0, metrics=None,
+                                     memory_limit=None, line_ocr=False):
+    """Process every receipt detected in the image and extract the total or subtotal for each.
 
-def extract_total_or_subtotal(extracted_text):
-    """Extract the total or subtotal from the formatted text."""
-    # Improved regex to match 'Sub Total', 'Total', or similar keywords with various spacing and formatting
-    match = re.search(r'(Sub\s*Total|Total|Sub-Total|Subtotal)[^\d]*(\d+\.\d{2})', extracted_text, re.IGNORECASE)
+    Returns the regions from pipeline.process_receipt_regions, each with the
+    parsed 'receipt' (see format_output.parse_receipt) and its 'total' added.
+    With memory_limit (bytes) the scan goes through pipeline.process_scan_regions instead.
+    """
+    # Get operations based on the image path
+    operations = get_operations_for_image(image_path)
 
-    if match:
-        total = float(match.group(2))
-        return total
+    if memory_limit is not None:
+        scan = load_receipt_scan(image_path, memory_limit, metrics)
+        regions = process_scan_regions(scan, operations, lang='eng', max_workers=max_workers, cache=cache,
+                                       metrics=metrics, line_ocr=line_ocr)
     else:
-        print("No subtotal or total found in the following text:")
-        print(extracted_text)
-        return 0.0
+        with stage(metrics, 'load'):
+            image = load_image(image_path)
+        if image is None:
+            raise ValueError(f"Could not read image: {image_path}")
 
-def process_receipts(image_paths):
-    """Process multiple receipts and extract the total or subtotal for each."""
-    totals = []
+        # Warp, preprocess and OCR all detected receipts concurrently
+        regions = process_receipt_regions(image, operations, lang='eng', max_workers=max_workers, cache=cache,
+                                          detection_scale=detection_scale, metrics=metrics, line_ocr=line_ocr)
 
-    for image_path in image_paths:
-        image = load_image(image_path)
+    for region in regions:
+        with stage(metrics, 'total'):
+            region['receipt'] = parse_receipt(region['text'])
+            region['total'] = receipt_total(region['receipt'], metrics)
+    return regions
 
-        # Apply edge detection and transformation
-        image = apply_edge_detection_and_transformation(image)
 
-        # Get operations based on the image path
-        operations = get_operations_for_image(image_path)
+def process_receipts(image_paths, all_regions=False, cache=None, detection_scale=1.0, profiler=None,
+                     memory_limit=None, line_ocr=False):
+    """Process multiple receipts and extract the total or subtotal for each.
 
-        # Dictionary of available operations
-        operation_functions = {
-            'grayscale': convert_to_grayscale,
-            'binarization': apply_binarization,
-            'dilation': apply_dilation,
-            'erosion': apply_erosion,
-            'sharpening': apply_sharpening
-        }
+    With all_regions=True every receipt found in an image gets its own entry.
+    """
+    totals = []
 
-        # Execute specified operations in order
-        for operation in operations:
-            if operation in operation_functions:
-                image = operation_functions[operation](image)
-            else:
-                print(f"Warning: '{operation}' is not a valid operation")
+    for image_path in image_paths:
+        metrics = profiler.start_image(image_path) if profiler is not None else None
+        if all_regions:
+            regions = process_receipt_regions_in_image(image_path, cache=cache, detection_scale=detection_scale,
+                                                       metrics=metrics, memory_limit=memory_limit, line_ocr=line_ocr)
+            for i, region in enumerate(regions):
+                totals.append((f"{image_path} [{i + 1}]", region['total']))
+        else:
+            total = process_receipt(image_path, cache=cache, detection_scale=detection_scale, metrics=metrics,
+                                    memory_limit=memory_limit, line_ocr=line_ocr)
+            totals.append((image_path, total))
 
-        extracted_text = extract_text_from_image(image, lang='eng')
+    return totals
 
-        # Extract the total or subtotal from the text
-        total = extract_total_or_subtotal(extracted_text)
-        totals.append((image_path, total))
 
-    return totals
+def visualize_totals(totals, output_path=None, max_bars=DEFAULT_MAX_BARS):
+    """Visualize the total sales using a bar chart.
 
+    totals is a list of (image_path, total) pairs or an aggregation.TotalsTable.
+    Above max_bars receipts the chart shows binned totals instead of one bar
+    per receipt. With output_path the chart is written to that PNG or SVG file
+    without opening a window.
+    """
+    table = totals if isinstance(totals, TotalsTable) else TotalsTable.from_totals(totals)
+    if output_path is not None:
+        return render_totals(table, output_path, max_bars=max_bars)
 
-def visualize_totals(totals):
-    """Visualize the total sales using a bar chart."""
-    image_names = [path.split('/')[-1] for path, total in totals]
-    total_values = [total for path, total in totals]
+    # pyplot takes longer to import than the rest of the pipeline, and only the interactive window needs it
+    import matplotlib.pyplot as plt
 
-    plt.figure(figsize=(10, 6))
-    plt.bar(image_names, total_values, color='skyblue')
-    plt.xlabel('Receipt Image')
-    plt.ylabel('Total Sales ($)')
-    plt.title('Total Sales from Receipts')
-    plt.xticks(rotation=45, ha="right")
+    figure = plt.figure(figsize=(10, 6 if len(table) <= max_bars else 12), layout='constrained')
+    plot_totals(figure, table, max_bars=max_bars)
     plt.show()
 
 
 if __name__ == "__main__":
-    image_paths = [
-        "images/Recept-I.png",
-        "images/Recept-II.png",
-        "images/Recept-III.png",
-        "images/Recept-IV.png",
-        "images/Recepts.png",
+    from ingestion import iter_image_paths
+
+    # Directories, glob patterns, files or '-' for paths on stdin
+    sources = sys.argv[1:] or [
+        "img/Recept-I.png",
+        "img/Recept-II.png",
+        "img/Recept-III.png",
+        "img/Recept-IV.png",
+        "img/Recepts.png",
     ]
 
     # Process all receipts and get the totals
-    totals = process_receipts(image_paths)
+    totals = process_receipts(iter_image_paths(sources))
 
     # Visualize the totals
     visualize_totals(totals)
\ No newline at end of file
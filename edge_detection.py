@@ -1,9 +1,11 @@
 import cv2
 import numpy as np
+from morphological_operations import get_kernel
 
 def apply_clahe(image, clip_limit=3.0, tile_grid_size=(8, 8)):
     """Apply CLAHE to enhance the contrast of the image."""
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    # Skip the conversion when the image is already grayscale
+    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
     clahe = cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tile_grid_size)
     cl1 = clahe.apply(gray_image)
     return cl1
@@ -16,61 +18,163 @@ def apply_adaptive_threshold(image, block_size=11, C=8):
 
 def apply_morphology(binary_image, kernel_size=(5, 5), iterations=2):
     """Apply morphological operations to enhance the binary image."""
-    kernel = np.ones(kernel_size, np.uint8)
+    kernel = get_kernel(tuple(kernel_size))
     closing = cv2.morphologyEx(binary_image, cv2.MORPH_CLOSE, kernel, iterations=iterations)
     dilated = cv2.dilate(closing, kernel, iterations=1)
     return dilated
 
-def find_receipt_contours(binary_image, min_area_ratio=0.01, max_area_ratio=0.95, min_height=200):
-    """Find all contours that could represent receipts in the image."""
+def _contour_bounding_boxes(contours):
+    """Return the (x, y, w, h) bounding boxes of all contours as NumPy arrays in one pass."""
+    lengths = np.fromiter(map(len, contours), dtype=np.intp, count=len(contours))
+    points = np.concatenate(contours).reshape(-1, 2)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    x = np.minimum.reduceat(points[:, 0], starts)
+    y = np.minimum.reduceat(points[:, 1], starts)
+    w = np.maximum.reduceat(points[:, 0], starts) - x + 1
+    h = np.maximum.reduceat(points[:, 1], starts) - y + 1
+    return x, y, w, h
+
+
+def find_receipt_contours(binary_image, min_area_ratio=0.01, max_area_ratio=0.95, min_height=200,
+                          return_quads=False, stats=None):
+    """Find all contours that could represent receipts in the image.
+
+    Returns a list of (x, y, w, h) boxes. With return_quads=True each entry is
+    ((x, y, w, h), quad), where quad is the 4x2 polygon approximation of the
+    contour, or None when it does not simplify to a quadrilateral. If a stats
+    dict is given, the contour counts at each filtering step are stored in it.
+    """
     contours, _ = cv2.findContours(binary_image, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if stats is not None:
+        stats['contours'] = len(contours)
+    if not contours:
+        return []
     h, w = binary_image.shape[:2]
     min_area = min_area_ratio * h * w
     max_area = max_area_ratio * h * w
 
+    # Reject on the bounding boxes first: a contour's area never exceeds its box,
+    # so only the survivors need the per-contour area computation
+    xs, ys, ws, hs = _contour_bounding_boxes(contours)
+    candidates = np.flatnonzero((hs >= min_height) & (ws.astype(np.int64) * hs > min_area))
+    if stats is not None:
+        stats['candidates'] = len(candidates)
+
     valid_contours = []
-    for contour in contours:
+    for i in candidates:
+        contour = contours[i]
         area = cv2.contourArea(contour)
-        x, y, w, h = cv2.boundingRect(contour)
 
-        # Filter based on area size and minimum height
-        if min_area < area < max_area and h >= min_height:
+        # Filter based on area size
+        if not min_area < area < max_area:
+            continue
+        box = (int(xs[i]), int(ys[i]), int(ws[i]), int(hs[i]))
+        if return_quads:
             epsilon = 0.02 * cv2.arcLength(contour, True)
             approx = cv2.approxPolyDP(contour, epsilon, True)
-            valid_contours.append((x, y, w, h))
+            quad = approx.reshape(4, 2) if len(approx) == 4 else None
+            valid_contours.append((box, quad))
+        else:
+            valid_contours.append(box)
     return valid_contours
 
-def combine_overlapping_rectangles(contours):
-    """Combine overlapping rectangles."""
-    if not contours:
-        return []
-
-    # Sort contours by the x coordinate
-    contours = sorted(contours, key=lambda x: x[0])
 
-    combined_rectangles = []
-    current = contours[0]
+# Candidate box pairs tested at once by the overlap sweep
+SWEEP_CHUNK_PAIRS = 1 << 18
+
+
+def _find_overlap_groups(x1, y1, x2, y2):
+    """Label boxes so that boxes that overlap, directly or through a chain, share a label."""
+    count = len(x1)
+
+    # Sweep left to right: only boxes starting before box i ends can overlap it,
+    # which is a contiguous run of the x-sorted order
+    order = np.argsort(x1, kind='stable')
+    starts = np.arange(1, count + 1)
+    ends = np.searchsorted(x1[order], x2[order], side='left')
+    lengths = np.clip(ends - starts, 0, None)
+
+    # Expand the sweep windows into candidate pairs and test them a chunk of windows at a time, so wide boxes
+    # with long windows cost time but not memory
+    cumulative = np.cumsum(lengths)
+    pairs = []
+    low = 0
+    while low < count:
+        done = cumulative[low - 1] if low else 0
+        high = max(int(np.searchsorted(cumulative, done + SWEEP_CHUNK_PAIRS, side='right')), low + 1)
+        chunk = lengths[low:high]
+        offsets = np.arange(chunk.sum()) - np.repeat(np.cumsum(chunk) - chunk, chunk)
+        first = order[np.repeat(np.arange(low, high), chunk)]
+        second = order[np.repeat(starts[low:high], chunk) + offsets]
+        overlapping = (x2[second] > x1[first]) & (y1[second] < y2[first]) & (y2[second] > y1[first])
+        pairs.append((first[overlapping], second[overlapping]))
+        low = high
+
+    parent = list(range(count))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first = np.concatenate([first for first, _ in pairs])
+    second = np.concatenate([second for _, second in pairs])
+    for i, j in zip(first.tolist(), second.tolist()):
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[root_j] = root_i
+
+    roots = np.array([find(i) for i in range(count)])
+    _, labels = np.unique(roots, return_inverse=True)
+    return labels
 
-    for next_rect in contours[1:]:
-        x1, y1, w1, h1 = current
-        x2, y2, w2, h2 = next_rect
 
-        # Check if rectangles overlap
-        if x1 < x2 + w2 and x1 + w1 > x2 and y1 < y2 + h2 and y1 + h1 > y2:
-            # Combine the rectangles
-            new_x = min(x1, x2)
-            new_y = min(y1, y2)
-            new_w = max(x1 + w1, x2 + w2) - new_x
-            new_h = max(y1 + h1, y2 + h2) - new_y
-            current = (new_x, new_y, new_w, new_h)
-        else:
-            combined_rectangles.append(current)
-            current = next_rect
+def combine_overlapping_rectangles(contours):
+    """Combine overlapping rectangles until none of the results overlap."""
+    if not contours:
+        return []
 
-    # Add the last rectangle
-    combined_rectangles.append(current)
+    boxes = np.asarray(contours, dtype=np.int64).reshape(-1, 4)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+
+    # A merged box can grow into boxes it did not touch before, so repeat until stable
+    while True:
+        labels = _find_overlap_groups(x1, y1, x2, y2)
+        count = labels.max() + 1
+        if count == len(x1):
+            break
+
+        merged_x1 = np.full(count, np.iinfo(np.int64).max)
+        merged_y1 = np.full(count, np.iinfo(np.int64).max)
+        merged_x2 = np.full(count, np.iinfo(np.int64).min)
+        merged_y2 = np.full(count, np.iinfo(np.int64).min)
+        np.minimum.at(merged_x1, labels, x1)
+        np.minimum.at(merged_y1, labels, y1)
+        np.maximum.at(merged_x2, labels, x2)
+        np.maximum.at(merged_y2, labels, y2)
+        x1, y1, x2, y2 = merged_x1, merged_y1, merged_x2, merged_y2
+
+    # Return the rectangles sorted by the x coordinate, as before
+    order = np.lexsort((y1, x1))
+    return [(int(x1[i]), int(y1[i]), int(x2[i] - x1[i]), int(y2[i] - y1[i])) for i in order]
+
+
+def combine_receipt_regions(regions):
+    """Combine overlapping (box, quad) regions from find_receipt_contours(return_quads=True).
+
+    Returns (box, quad) pairs for the boxes of combine_overlapping_rectangles.
+    A merged box keeps the quad of a contour whose box already spans all of
+    it, and gets None when it was pieced together from several contours.
+    """
+    quads = {}
+    for box, quad in regions:
+        if quad is not None:
+            quads.setdefault(box, quad)
+    return [(box, quads.get(box)) for box in combine_overlapping_rectangles([box for box, _ in regions])]
 
-    return combined_rectangles
 
 def draw_bounding_boxes(image, contours, color=(0, 255, 0), thickness=3):
     """Draw bounding boxes around all detected contours."""
@@ -80,7 +184,7 @@ def draw_bounding_boxes(image, contours, color=(0, 255, 0), thickness=3):
     return image_with_boxes
 
 def main():
-    image_path = 'images/Recepts.png'
+    image_path = 'img/Recepts.png'
     image = cv2.imread(image_path)
     if image is None:
         print("Image not found.")
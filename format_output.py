@@ -1,70 +1,216 @@
+import datetime
 import re
 
-def format_text(text):
-    """Format the OCR extracted text into a structured receipt format."""
+# Headings that start a new line, and the item table header that sits on a line of its own
+_HEADING = re.compile(r'(RESTAURANT|Lorem Ipsum|City Index|Tel:|TAX INVOICE|CASH RECEIPT|BAKERY|Sub Total)')
+_TABLE_HEADER = re.compile(r'(Name\s+Qty\s+Total)')
+_HYPHEN = re.compile(r'\s*-\s*')
+_PIPE = re.compile(r'\s*\|\s*')
+# Numbers that are missing decimal points, assuming 3 or 4 digits are cents
+_BARE_PRICE = re.compile(r'\b\d{3,4}\b(?!\.\d{2})')
+# A price ends its line; newlines come from the heading breaks
+_LINE_TOKEN = re.compile(r'(\d+\.\d{2})|\n')
+_ITEM_QTY = re.compile(r'(.+?)\s+(\d+)\s*$')
+_CHANGE_LINE = re.compile(r'(Change\s+\d+\.\d{2})')
+# Labels of the receipt total, spaced the way normalize_text leaves them, e.g. "Sub - Total"
+_TOTAL_LABEL = re.compile(r'Sub\s*(?:-\s*)?Total|Total', re.IGNORECASE)
+# Dates are read from the raw text, since normalizing spaces out hyphens and turns years into prices
+_ISO_DATE = re.compile(r'\b(\d{4})-(\d{1,2})-(\d{1,2})\b')
+_DAY_FIRST_DATE = re.compile(r'\b(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}|\d{2})\b')
+
+# Lines without a price that get a blank line before them
+SECTION_LABELS = ('RESTAURANT', 'CASH RECEIPT', 'Sub Total', 'Cash', 'Change', 'BAKERY')
+# Priced lines that are payment details rather than items
+PAYMENT_LABELS = ('cash', 'change')
+
+
+def _correct_price(match):
+    """Turn a 3 or 4 digit number into a price, e.g. 150 into 1.50."""
+    return f"{int(match.group()) / 100:.2f}"
+
+
+def normalize_text(text):
+    """Clean up OCR text and insert the line breaks before headings, with prices still inline."""
     # Remove any leading/trailing whitespace and fix multiple spaces
-    text = re.sub(r'\s+', ' ', text.strip())
+    text = ' '.join(text.split())
 
     # Ensure proper spacing around symbols like hyphens and dashes
-    text = re.sub(r'\s*-\s*', ' - ', text)
-    text = re.sub(r'\s*\|\s*', ' | ', text)
+    if '-' in text:
+        text = _HYPHEN.sub(' - ', text)
+    if '|' in text:
+        text = _PIPE.sub(' | ', text)
 
-    # Insert line breaks before specific headings
-    text = re.sub(r'(RESTAURANT|Lorem Ipsum|City Index|Tel:|TAX INVOICE|CASH RECEIPT|BAKERY|Sub Total)', r'\n\1', text)
+    # Insert line breaks before specific headings and around the "Name Qty Total" line
+    text = _HEADING.sub(r'\n\1', text)
+    if 'Qty' in text:
+        text = _TABLE_HEADER.sub(r'\n\1\n', text)
+    return _BARE_PRICE.sub(_correct_price, text)
 
-    # Correct the "Name Qty Total" line
-    text = re.sub(r'(Name\s+Qty\s+Total)', r'\n\1\n', text)
 
-    # Correct numbers that are missing decimal points, assuming 3 or 4 digits are cents
-    def correct_price(match):
-        number = match.group()
-        if len(number) == 3 or len(number) == 4:
-            return f"{int(number) / 100:.2f}"
-        return number
+def _parse_line(line, price=None):
+    """Return the structured form of one receipt line, including its formatted text."""
+    if price is None:
+        line = line.strip()
+        # Ensure "Sub Total" and other labels are set apart from the lines before them
+        text = f"\n{line}" if line.startswith(SECTION_LABELS) else line
+        return {'text': text, 'name': line, 'qty': None, 'price': None}
+
+    # Split the item part into name and quantity if both are present
+    item_part = line.strip()
+    item_match = _ITEM_QTY.match(item_part)
+    if item_match:
+        name = item_match.group(1).strip()
+        qty = item_match.group(2).strip()
+        return {'text': f"{name:<25} {qty:>3}  {price:>7}", 'name': name, 'qty': int(qty), 'price': float(price)}
+    return {'text': f"{item_part:<25}      {price:>7}", 'name': item_part, 'qty': None, 'price': float(price)}
 
-    text = re.sub(r'\b\d{3,4}\b(?!\.\d{2})', correct_price, text)
 
-    # Insert line breaks after prices to ensure they are on their own line
-    text = re.sub(r'(\d+\.\d{2})', r'\1\n', text)
+def parse_lines(text):
+    """Split OCR text into structured receipt lines in a single pass.
 
-    # Split the text into lines for further formatting
-    lines = text.splitlines()
-    formatted_lines = []
+    Each line is a dict with 'text' (the formatted line), 'name', 'qty' and
+    'price'; qty and price are None on lines without them.
+    """
+    # Alternates line text and what ended it: a price, or None for a line break
+    parts = _LINE_TOKEN.split(normalize_text(text))
+    lines = [_parse_line(parts[i], parts[i + 1]) for i in range(0, len(parts) - 1, 2)]
 
+    # Like str.splitlines(), a trailing line break does not start another line
+    if parts[-1]:
+        lines.append(_parse_line(parts[-1]))
+    return lines
+
+
+def parse_date(text):
+    """Return the first date in the text as an ISO 'YYYY-MM-DD' string, or None.
+
+    Accepts ISO dates and day-first dates such as 31/12/2024 or 31.12.24.
+    """
+    match = _ISO_DATE.search(text)
+    if match:
+        year, month, day = (int(group) for group in match.groups())
+    else:
+        match = _DAY_FIRST_DATE.search(text)
+        if not match:
+            return None
+        day, month, year = (int(group) for group in match.groups())
+        if year < 100:
+            year += 2000
+    try:
+        # Rejects OCR misreads such as 31/02/2024 that no calendar has
+        return datetime.date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def _store_name(lines):
+    """Return the receipt's first line as the store name, or None if it is already an item."""
     for line in lines:
-        line = line.strip()
+        if line['name'] or line['price'] is not None:
+            return line['name'] if line['price'] is None else None
+    return None
+
+
+def _diagnostic(code, message, **details):
+    """Build a structured diagnostic for a receipt that did not parse cleanly."""
+    return {'code': code, 'message': message, **details}
 
-        # Handle lines that are likely items with prices
-        if re.search(r'\d+\.\d{2}', line):
-            parts = re.split(r'(\d+\.\d{2})', line)
-            item_part = parts[0].strip()
-            price_part = parts[1].strip()
-
-            # Split item part into name and quantity if both are present
-            item_match = re.match(r'(.+?)\s+(\d+)\s*$', item_part)
-            if item_match:
-                name = item_match.group(1).strip()
-                qty = item_match.group(2).strip()
-                formatted_lines.append(f"{name:<25} {qty:>3}  {price_part:>7}")
-            else:
-                formatted_lines.append(f"{item_part:<25}      {price_part:>7}")
+
+def parse_receipt(text):
+    """Parse OCR text once into the receipt model used for formatting and totals.
+
+    Returns a dict with 'lines' (from parse_lines), 'store' (the heading line
+    at the top, or None), 'date' (see parse_date), 'items' ({'name', 'qty', 'price'} dicts),
+    'subtotal', 'total', 'amount' (whichever of the two comes first, as the
+    receipt's total), 'confidence' from 0 to 1 and 'diagnostics', a list of
+    {'code', 'message', ...} dicts explaining anything that lowered the
+    confidence.
+    """
+    lines = parse_lines(text)
+    items = []
+    subtotal = total = amount = None
+    same_line = False
+    pending_label = None  # A total label whose price is on the next line
+    past_items = False    # Lines after the first total label are tax, payment and the like, not items
+
+    for line in lines:
+        name = line['name']
+        label = None if _TABLE_HEADER.match(name) else _TOTAL_LABEL.search(name)
+        past_items = past_items or label is not None
+        if line['price'] is None:
+            pending_label = label
+            continue
+
+        on_label_line = label is not None
+        if label is None and line['qty'] is None:
+            label = pending_label
+        pending_label = None
+        if label is None:
+            if not past_items and not name.lower().startswith(PAYMENT_LABELS):
+                items.append({'name': name, 'qty': line['qty'], 'price': line['price']})
+            continue
+
+        if label.group().lower().startswith('sub'):
+            if subtotal is None:
+                subtotal = line['price']
+        elif total is None:
+            total = line['price']
+        if amount is None:
+            amount = line['price']
+            same_line = on_label_line
+
+    diagnostics = []
+    confidence = 0.0
+    if amount is None:
+        diagnostics.append(_diagnostic('no_total', "No subtotal or total found", lines=len(lines)))
+    else:
+        # A total label is the minimum; item prices adding up to it and the price
+        # sitting on the label's own line each make the reading more trustworthy
+        confidence = 0.5
+        items_total = round(sum(item['price'] for item in items), 2)
+        if items and abs(items_total - amount) < 0.005:
+            confidence += 0.4
+        else:
+            diagnostics.append(_diagnostic('items_mismatch', "Line items do not add up to the total",
+                                           items_total=items_total, amount=amount, items=len(items)))
+        if same_line:
+            confidence += 0.1
         else:
-            # Ensure "Sub Total" and other labels are properly formatted without extra spaces
-            if re.match(r'(RESTAURANT|CASH RECEIPT|Sub Total|Cash|Change|BAKERY)', line):
-                formatted_lines.append(f"\n{line}")
-            else:
-                # Format regular lines
-                formatted_lines.append(line)
-
-    # Combine formatted lines into the final text
-    formatted_text = "\n".join(formatted_lines)
-    formatted_text = re.sub(r'(Sub Total)', r'\n\1', formatted_text)  # Add space before "Sub Total"
-    formatted_text = re.sub(r'(Change\s+\d+\.\d{2})', r'\1\n\n', formatted_text)  # Space after "Change"
+            diagnostics.append(_diagnostic('split_total', "Total label and amount are on separate lines"))
 
+    return {
+        'lines': lines,
+        'store': _store_name(lines),
+        'date': parse_date(text),
+        'items': items,
+        'subtotal': subtotal,
+        'total': total,
+        'amount': amount,
+        'confidence': round(confidence, 2),
+        'diagnostics': diagnostics,
+    }
+
+
+def render_lines(lines):
+    """Combine parsed lines into the final receipt text."""
+    formatted_text = "\n".join(line['text'] for line in lines)
+    formatted_text = formatted_text.replace('Sub Total', '\nSub Total')  # Add space before "Sub Total"
+    if 'Change' in formatted_text:
+        formatted_text = _CHANGE_LINE.sub(r'\1\n\n', formatted_text)  # Space after "Change"
     return formatted_text
 
+
+def format_text(text):
+    """Format the OCR extracted text into a structured receipt format."""
+    return render_lines(parse_lines(text))
+
+
+def format_receipt(receipt):
+    """Format a receipt already parsed by parse_receipt, without parsing the text again."""
+    return render_lines(receipt['lines'])
+
 def print_formatted_text(text):
     """Print the formatted text."""
     formatted_text = format_text(text)
     print("Formatted Receipt:\n")
-    print(formatted_text)
\ No newline at end of file
+    print(formatted_text)
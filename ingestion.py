@@ -0,0 +1,159 @@
+import glob
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+
+from data_visualization import process_receipt_image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp')
+
+
+def is_image_file(path):
+    """Return True if the path looks like an image the pipeline can decode."""
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def _iter_directory(directory):
+    """Yield the image files directly inside a directory in name order."""
+    with os.scandir(directory) as entries:
+        names = sorted(entry.name for entry in entries if entry.is_file() and is_image_file(entry.name))
+    for name in names:
+        yield os.path.join(directory, name)
+
+
+def _iter_source(source, stdin):
+    """Yield image paths from one source: '-', a directory, a glob pattern or a file."""
+    if source == '-':
+        # One path per line, read lazily so a producer can keep piping paths in
+        for line in stdin:
+            path = line.strip()
+            if path:
+                yield path
+    elif os.path.isdir(source):
+        yield from _iter_directory(source)
+    elif glob.has_magic(source):
+        for path in sorted(glob.iglob(source, recursive=True)):
+            if os.path.isfile(path) and is_image_file(path):
+                yield path
+    else:
+        yield source
+
+
+def iter_image_paths(sources, watch=False, poll_interval=1.0, stdin=None):
+    """Yield image paths from directories, glob patterns, files or '-' for stdin.
+
+    With watch=True the directories and patterns are polled every
+    poll_interval seconds after the first pass and new images are yielded
+    as they appear, until the consumer stops iterating. A new image is only
+    yielded once its size and modification time are unchanged between two
+    polls, so a scan still being written is not read half-finished.
+    """
+    if stdin is None:
+        stdin = sys.stdin
+
+    seen = set()
+    for source in sources:
+        for path in _iter_source(source, stdin):
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+    watched = [source for source in sources if source != '-' and (os.path.isdir(source) or glob.has_magic(source))]
+    # New paths mapped to their (size, mtime) at the last poll, until it stops changing
+    growing = {}
+    while watch and watched:
+        time.sleep(poll_interval)
+        listed = {}
+        for source in watched:
+            for path in _iter_source(source, stdin):
+                if path in seen or path in listed:
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                listed[path] = (stat.st_size, stat.st_mtime_ns)
+        for path, signature in listed.items():
+            if growing.get(path) == signature:
+                seen.add(path)
+                yield path
+        growing = {path: signature for path, signature in listed.items() if path not in seen}
+
+
+def iter_decoded_images(image_paths, max_queue=4, decode=cv2.imread):
+    """Decode images on a background thread and yield (image_path, image) in order.
+
+    The bounded queue applies backpressure: decoding never runs more than
+    max_queue images ahead of the consumer, so memory stays constant no
+    matter how long the path stream is. image is None if decoding failed.
+    """
+    decoded = queue.Queue(maxsize=max_queue)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        # Wait for room in the queue, but give up if the consumer has gone away
+        while not stop.is_set():
+            try:
+                decoded.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def decode_all():
+        try:
+            for image_path in image_paths:
+                try:
+                    image = decode(image_path)
+                except Exception:
+                    image = None
+                if not put((image_path, image)):
+                    return
+        except Exception as exc:
+            put(exc)
+            return
+        put(done)
+
+    thread = threading.Thread(target=decode_all, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = decoded.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()
+
+
+def stream_receipts(sources, watch=False, max_queue=4, cache=None, detection_scale=1.0):
+    """Run the receipt pipeline over streamed sources and yield (image_path, total, error).
+
+    Images are decoded lazily, at most max_queue ahead of detection,
+    preprocessing and OCR, so a backlog of any size runs in constant memory.
+    """
+    for image_path, image in iter_decoded_images(iter_image_paths(sources, watch=watch), max_queue=max_queue):
+        if image is None:
+            yield image_path, 0.0, f"ValueError: Could not read image: {image_path}"
+            continue
+        try:
+            total = process_receipt_image(image, image_path, cache=cache, detection_scale=detection_scale)
+        except Exception as exc:
+            yield image_path, 0.0, f"{type(exc).__name__}: {exc}"
+            continue
+        yield image_path, total, None
+
+
+if __name__ == "__main__":
+    for image_path, total, error in stream_receipts(sys.argv[1:] or ['-']):
+        if error:
+            print(f"{image_path}: failed ({error})")
+        else:
+            print(f"{image_path}: {total:.2f}")
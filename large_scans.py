@@ -0,0 +1,167 @@
+import mmap
+import os
+import struct
+import tempfile
+
+import cv2
+import numpy as np
+
+# Memory ceiling per worker for a scan and its detection images
+DEFAULT_MEMORY_LIMIT = 1024 * 1024 * 1024
+
+# Full-frame single-channel images the detection chain holds at once: gray, CLAHE, binary, morphed and the
+# contour scratch copy
+DETECTION_PLANES = 5
+# Detection is never run on an image whose longer side is shorter than this, whatever the memory limit
+MIN_DETECTION_SIZE = 1024
+
+# Decoder flags for each reduction factor of the detection image. Scan mode ignores EXIF orientation, which
+# flatbed scans do not carry, so the size read from the header is the decoded size.
+REDUCED_GRAYSCALE = {
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2 | cv2.IMREAD_IGNORE_ORIENTATION,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4 | cv2.IMREAD_IGNORE_ORIENTATION,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8 | cv2.IMREAD_IGNORE_ORIENTATION,
+}
+FULL_GRAYSCALE = cv2.IMREAD_GRAYSCALE | cv2.IMREAD_IGNORE_ORIENTATION
+FULL_COLOR = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+
+# JPEG start-of-frame markers, which carry the image size; C4, C8 and CC are other segments
+_JPEG_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def read_image_size(image_path):
+    """Return (width, height) from a PNG or JPEG header without decoding, or None for other files."""
+    with open(image_path, 'rb') as file:
+        head = file.read(24)
+        if head[:8] == b'\x89PNG\r\n\x1a\n' and head[12:16] == b'IHDR':
+            return struct.unpack('>II', head[16:24])
+        if head[:2] != b'\xff\xd8':
+            return None
+
+        file.seek(2)
+        while True:
+            segment = file.read(4)
+            if len(segment) < 4 or segment[0] != 0xFF:
+                return None
+            marker, length = segment[1], struct.unpack('>H', segment[2:])[0]
+            if marker in _JPEG_SOF:
+                height, width = struct.unpack('>xHH', file.read(5))
+                return width, height
+            file.seek(length - 2, os.SEEK_CUR)
+
+
+def plan_scan(width, height, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """Return (reduction, memory_map) that keep decoding and detecting a scan within memory_limit bytes.
+
+    The full-resolution BGR frame is memory-mapped to a temporary file when
+    it would take more than half of the limit, and detection runs on the
+    smallest reduction of 1, 2, 4 or 8 whose planes fit in what is left,
+    but not on one smaller than MIN_DETECTION_SIZE.
+    """
+    frame_bytes = 3 * width * height
+    memory_map = frame_bytes > memory_limit // 2
+    available = memory_limit - (0 if memory_map else frame_bytes)
+    reduction = 1
+    while reduction < 8 and max(width, height) // (2 * reduction) >= MIN_DETECTION_SIZE and \
+            DETECTION_PLANES * -(-width // reduction) * -(-height // reduction) > available:
+        reduction *= 2
+    return reduction, memory_map
+
+
+class ScanImage:
+    """A scan decoded at reduced resolution for detection, with its receipt regions read at full resolution.
+
+    detection_image is a grayscale copy 1/reduction the size of the scan.
+    The full-resolution frame is only decoded when regions are cropped,
+    into memory or, for frames over half the memory limit, into a
+    memory-mapped temporary file, and the scan lets go of it right after.
+    """
+
+    def __init__(self, image_path, shape, detection_image, reduction, memory_map=False, frame=None):
+        self.path = image_path
+        self.shape = shape
+        self.detection_image = detection_image
+        self.reduction = reduction
+        self.memory_map = memory_map
+        self._frame = frame
+        self._mapped = False
+
+    def frame(self):
+        """Return the full-resolution BGR frame, decoding it on first use."""
+        if self._frame is not None:
+            return self._frame
+        if not self.memory_map:
+            frame = cv2.imread(self.path, FULL_COLOR)
+        else:
+            # The mapping keeps the temporary file alive, and unmapping it deletes the file
+            size = self.shape[0] * self.shape[1] * self.shape[2]
+            with tempfile.TemporaryFile() as spill:
+                spill.truncate(size)
+                mapping = mmap.mmap(spill.fileno(), size)
+            buffer = np.frombuffer(mapping, np.uint8).reshape(self.shape)
+            frame = cv2.imread(self.path, buffer, FULL_COLOR)
+            # OpenCV decodes into a new array instead if the header size was wrong
+            self._mapped = frame is not None and np.shares_memory(frame, buffer)
+            if self._mapped:
+                # Drop the decoded pages from this process; cropping faults back in only the receipt rows
+                mapping.madvise(mmap.MADV_DONTNEED)
+        if frame is None:
+            raise ValueError(f"Could not read image: {self.path}")
+        self._frame = frame
+        return frame
+
+    def crop_regions(self, bounding_boxes):
+        """Return the full-resolution region of each (x, y, w, h) box, then release the frame.
+
+        Regions of a memory-mapped frame are views, whose pages the kernel
+        can evict and read back from the file; the mapping goes away with the
+        last of them. Regions of an in-memory frame are copies, so the frame
+        itself is freed right away.
+        """
+        frame = self.frame()
+        mapped = self._mapped
+        self.release()
+        regions = [frame[y:y + h, x:x + w] for x, y, w, h in bounding_boxes]
+        if mapped:
+            return regions
+        return [region.copy() for region in regions]
+
+    def release(self):
+        """Drop the full-resolution frame; it is decoded again if needed."""
+        self._frame = None
+        self._mapped = False
+
+
+def load_scan(image_path, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """Decode a scan for detection within memory_limit bytes, returning a ScanImage or None if unreadable.
+
+    PNG and JPEG sizes come from the file header, so a large scan is never
+    decoded whole for detection; JPEG is even decoded at the reduced scale.
+    Other formats are decoded in memory and downscaled for detection. The
+    returned scan holds only its detection image, never the color frame,
+    so scans prefetched ahead of detection stay within their plan; the
+    frame is decoded again when regions are cropped.
+    """
+    try:
+        size = read_image_size(image_path)
+    except OSError:
+        return None
+
+    if size is None:
+        frame = cv2.imread(image_path, FULL_COLOR)
+        if frame is None:
+            return None
+        shape = frame.shape
+        reduction, memory_map = plan_scan(shape[1], shape[0], memory_limit)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        del frame
+        if reduction > 1:
+            gray = cv2.resize(gray, None, fx=1 / reduction, fy=1 / reduction, interpolation=cv2.INTER_AREA)
+        return ScanImage(image_path, shape, gray, reduction, memory_map=memory_map)
+
+    width, height = size
+    reduction, memory_map = plan_scan(width, height, memory_limit)
+    detection_image = cv2.imread(image_path, REDUCED_GRAYSCALE.get(reduction, FULL_GRAYSCALE))
+    if detection_image is None:
+        return None
+    return ScanImage(image_path, (height, width, 3), detection_image, reduction, memory_map=memory_map)
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from ocr_functions import DEFAULT_CONFIG, get_ocr_backend
+
+# Tesseract config for a strip holding a single text line
+LINE_CONFIG = r'--oem 3 --psm 7'
+
+# Rows whose share of ink pixels is at most this are blank, which ignores specks of noise
+BLANK_ROW = 0.002
+# Rows or columns with more ink than this are borders, background or rules rather than text
+SOLID = 0.6
+# Gaps of at most this many rows inside a line are closed, e.g. between the dot and the stem of an 'i'
+MIN_LINE_GAP = 2
+# Bands lower than this many pixels are noise
+MIN_LINE_HEIGHT = 5
+# Pixels of paper added around each strip
+STRIP_MARGIN = 10
+# Bands taller than this multiple of the median line height hold several lines and get block OCR
+MAX_LINE_RATIO = 1.8
+
+
+def ink_mask(image):
+    """Return (mask, light_ink): the ink pixels and whether ink is lighter than the paper.
+
+    Ink is the minority Otsu class, since the binarization operation leaves
+    white text on black and either polarity is possible.
+    """
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    mask = binary.view(bool)
+    light_ink = np.count_nonzero(mask) <= mask.size // 2
+    return (mask if light_ink else ~mask), light_ink
+
+
+def find_text_lines(image, ink=None):
+    """Find the text lines of a receipt from its horizontal projection profile.
+
+    Returns (top, bottom) row ranges, top to bottom, with a little padding
+    that never reaches into the neighbouring lines. Columns and rows that are
+    mostly ink, such as background left around the paper by the warp, are
+    left out of the profile. ink is the mask from ink_mask, if already computed.
+    """
+    if ink is None:
+        ink, _ = ink_mask(image)
+    height, width = ink.shape
+    columns = np.count_nonzero(ink, axis=0) <= SOLID * height
+    profile = np.count_nonzero(ink[:, columns], axis=1)
+    text_width = max(int(np.count_nonzero(columns)), 1)
+    rows = (profile > BLANK_ROW * text_width) & (profile <= SOLID * text_width)
+
+    # Starts and ends of the runs of text rows
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], rows.view(np.int8), [0]))))
+    starts, ends = edges[0::2], edges[1::2]
+    if not len(starts):
+        return []
+
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] > MIN_LINE_GAP))
+    starts = starts[keep]
+    ends = np.concatenate((ends[np.flatnonzero(keep)[1:] - 1], ends[-1:]))
+    tall = ends - starts >= MIN_LINE_HEIGHT
+    starts, ends = starts[tall], ends[tall]
+
+    lines = []
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        padding = max(2, (end - start) // 4)
+        top = max(start - padding, (ends[i - 1] + start) // 2 if i else 0)
+        bottom = min(end + padding, (end + starts[i + 1]) // 2 if i + 1 < len(starts) else height)
+        lines.append((int(top), int(bottom)))
+    return lines
+
+
+def extract_text_by_lines(image, lang='eng', config=LINE_CONFIG, backend=None, max_workers=None):
+    """OCR a receipt line by line, recognising the strips concurrently and stitching the text in order.
+
+    Each strip found by find_text_lines is read with the single-line config;
+    bands too tall for one line are read as a block with DEFAULT_CONFIG.
+    Strips are inverted to dark text if needed and framed with paper, which
+    Tesseract needs around a single line. An image with fewer than two lines
+    is read whole. Backends with a submit
+    method (the worker pool) get every strip queued at once, others are
+    called from max_workers threads.
+    """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if backend is None:
+        backend = get_ocr_backend()
+
+    ink, light_ink = ink_mask(image)
+    lines = find_text_lines(image, ink)
+    if len(lines) < 2:
+        return backend.image_to_string(image, lang=lang, config=DEFAULT_CONFIG)
+
+    # Tesseract reads a strip with no page around it far better as dark text on a light margin
+    if light_ink:
+        image = cv2.bitwise_not(image)
+    paper = int(np.median(image[~ink]))
+    line_height = np.median([bottom - top for top, bottom in lines])
+    strips = []
+    for top, bottom in lines:
+        strip_config = config if bottom - top <= MAX_LINE_RATIO * line_height else DEFAULT_CONFIG
+        strip = cv2.copyMakeBorder(image[top:bottom], STRIP_MARGIN, STRIP_MARGIN, STRIP_MARGIN, STRIP_MARGIN,
+                                   cv2.BORDER_CONSTANT, value=paper)
+        strips.append((strip, strip_config))
+
+    if hasattr(backend, 'submit'):
+        futures = [backend.submit(strip, lang, strip_config) for strip, strip_config in strips]
+        texts = [future.result() for future in futures]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            texts = list(executor.map(lambda item: backend.image_to_string(item[0], lang=lang, config=item[1]),
+                                      strips))
+
+    text = '\n'.join(line for line in (text.strip() for text in texts) if line)
+    return text + '\n' if text else ''
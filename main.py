@@ -1,17 +1,15 @@
+import sys
+
 import cv2
-from grayscale import convert_to_grayscale
-from binarization import apply_binarization
-from morphological_operations import apply_dilation, apply_erosion
-from sharpening import apply_sharpening
-from edge_detection import (
-    apply_clahe,
-    apply_adaptive_threshold,
-    apply_morphology,
-    find_receipt_contours,
-    combine_overlapping_rectangles
+from transformation import get_perspective_transform
+from pipeline import (
+    detect_receipt_boxes,
+    apply_operations,
+    extract_receipt_text,
+    process_receipt_regions,
+    resolve_operations
 )
-from transformation import draw_transformed_receipts
-from ocr_functions import extract_text_from_image
+from pipeline_config import get_operations_for_image
 from format_output import print_formatted_text
 
 
@@ -21,71 +19,49 @@ def load_image(image_path):
     return image
 
 
-def apply_edge_detection_and_transformation(image):
+def apply_edge_detection_and_transformation(image, detection_scale=1.0):
     """Apply edge detection and transformation to the image."""
-    # Step 1: Enhance contrast and apply adaptive thresholding
-    cl1 = apply_clahe(image)
-    binary_image = apply_adaptive_threshold(cl1)
-
-    # Step 2: Apply morphological operations
-    morphed_image = apply_morphology(binary_image)
-
-    # Step 3: Detect all contours that could be receipts, with a minimum height of 200 pixels
-    bounding_boxes = find_receipt_contours(morphed_image, min_height=200)
+    # Detect all receipts in the image, optionally on a downscaled copy
+    regions = detect_receipt_boxes(image, detection_scale=detection_scale, return_quads=True)
 
-    # Step 4: Combine overlapping rectangles
-    combined_boxes = combine_overlapping_rectangles(bounding_boxes)
+    # Apply the perspective transformation to the first detected receipt for further processing
+    bounding_box, quad = regions[0]
+    return get_perspective_transform(image, bounding_box, quad)
 
-    # Step 5: Apply the perspective transformation to each detected receipt
-    transformed_receipts = draw_transformed_receipts(image, combined_boxes)
 
-    return transformed_receipts[0]  # Return the first transformed receipt for further processing
+def main_all_regions(image_path, cache=None, detection_scale=1.0, line_ocr=False):
+    image = load_image(image_path)
 
+    # Get operations based on the image path
+    operations = get_operations_for_image(image_path)
 
-def get_operations_for_image(image_path):
-    """Return the list of operations based on the image path."""
-    # Define the operations for specific image paths or patterns
-    operations_by_image = {
-        "images/Recept-I.png": ['grayscale', 'dilation', 'sharpening', 'erosion'],
-        "images/Recept-II.png": ['grayscale', 'sharpening', 'binarization', ],
-        "images/Recept-III.png": ['grayscale', 'sharpening' ],
-        "images/Recept-IV.png": [ 'sharpening', ],
-        "images/Recepts.png": ['grayscale', 'sharpening', 'binarization'],
-    }
+    # Warp, preprocess and OCR every detected receipt concurrently
+    regions = process_receipt_regions(image, operations, lang='eng', cache=cache,
+                                      detection_scale=detection_scale, line_ocr=line_ocr)
 
-    # Default operations if the image path doesn't match any specific case
-    default_operations = ['grayscale', 'binarization']
+    for i, region in enumerate(regions):
+        x, y, w, h = region['box']
+        print(f"Receipt {i + 1} at (x={x}, y={y}, w={w}, h={h})")
+        print_formatted_text(region['text'])
+        print('-' * 50)
 
-    # Return the operations based on the image path, or the default if not found
-    return operations_by_image.get(image_path, default_operations)
 
+def main(image_path, all_regions=False, cache=None, detection_scale=1.0, line_ocr=False):
+    if all_regions:
+        return main_all_regions(image_path, cache=cache, detection_scale=detection_scale, line_ocr=line_ocr)
 
-def main(image_path):
     image = load_image(image_path)
 
     # Apply edge detection and transformation
-    image = apply_edge_detection_and_transformation(image)
+    image = apply_edge_detection_and_transformation(image, detection_scale=detection_scale)
 
-    # Get operations based on the image path
-    operations = get_operations_for_image(image_path)
-
-    # Dictionary of available operations
-    operation_functions = {
-        'grayscale': convert_to_grayscale,
-        'binarization': apply_binarization,
-        'dilation': apply_dilation,
-        'erosion': apply_erosion,
-        'sharpening': apply_sharpening
-    }
+    # Get operations based on the image path, choosing them from the receipt itself for 'auto'
+    operations = resolve_operations(image, get_operations_for_image(image_path))
 
     # Execute specified operations in order
-    for operation in operations:
-        if operation in operation_functions:
-            image = operation_functions[operation](image)
-        else:
-            print(f"Warning: '{operation}' is not a valid operation")
+    image = apply_operations(image, operations)
 
-    extracted_text = extract_text_from_image(image, lang='eng')
+    extracted_text = extract_receipt_text(image, operations, lang='eng', cache=cache, line_ocr=line_ocr)
 
     # # Print the extracted text
     # print("Extracted Text from Image:")
@@ -99,5 +75,9 @@ def main(image_path):
 
 
 if __name__ == "__main__":
-    image_path = "images/Recepts.png"
-    main(image_path)
\ No newline at end of file
+    from ingestion import iter_image_paths
+
+    # Directories, glob patterns, files or '-' for paths on stdin
+    sources = sys.argv[1:] or ["img/Recepts.png"]
+    for image_path in iter_image_paths(sources):
+        main(image_path)
\ No newline at end of file
@@ -1,14 +1,21 @@
 import cv2
 import numpy as np
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def get_kernel(kernel_size):
+    """Return a cached rectangular structuring element of the given size."""
+    kernel = np.ones(kernel_size, np.uint8)
+    kernel.setflags(write=False)
+    return kernel
 
 
 def apply_dilation(image, kernel_size=(2,2), iterations=1):
     """Apply dilation to the image."""
-    kernel = np.ones(kernel_size, np.uint8)
-    return cv2.dilate(image, kernel, iterations=iterations)
+    return cv2.dilate(image, get_kernel(tuple(kernel_size)), iterations=iterations)
 
 
 def apply_erosion(image, kernel_size=(2,2), iterations=1):
     """Apply erosion to the image."""
-    kernel = np.ones(kernel_size, np.uint8)
-    return cv2.erode(image, kernel, iterations=iterations)
\ No newline at end of file
+    return cv2.erode(image, get_kernel(tuple(kernel_size)), iterations=iterations)
\ No newline at end of file
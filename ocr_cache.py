@@ -0,0 +1,187 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from ocr_functions import DEFAULT_CONFIG, extract_text_from_image
+from preprocessing import operation_label
+
+# Bump this when a change to the OCR path should invalidate every stored result
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'cgv-receipts', 'ocr_cache.sqlite3')
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Least recently used entries dropped per eviction query
+EVICT_BATCH = 64
+
+
+class OCRCache:
+    """Persistent, size-bounded LRU cache of OCR results stored in SQLite.
+
+    Entries are keyed on the preprocessed pixel buffer, the operation list,
+    the language and the Tesseract config, so any change to the input or the
+    pipeline produces a new key. The total size of the entries is kept in a
+    meta row, updated in the same transaction as the entries, so a put does
+    not have to sum the whole table.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def __getstate__(self):
+        # Connections cannot cross process boundaries; each worker reopens its own
+        state = self.__dict__.copy()
+        state['_lock'] = None
+        state['_conn'] = None
+        state['_pid'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """Return a connection owned by the current process."""
+        if self._conn is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ocr_cache_last_access ON ocr_cache (last_access)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS ocr_cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # Summed once, for caches written before the total was kept
+            self._conn.execute("INSERT OR IGNORE INTO ocr_cache_meta (name, value) "
+                               "SELECT 'bytes', COALESCE(SUM(size), 0) FROM ocr_cache")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def make_key(image, operations=(), lang='eng', config=DEFAULT_CONFIG):
+        """Build the cache key for an image and the pipeline configuration that produced it."""
+        image = np.ascontiguousarray(image)
+        digest = hashlib.sha256()
+        digest.update(f"v{CACHE_VERSION}|{image.shape}|{image.dtype.str}|".encode())
+        digest.update(f"{','.join(map(operation_label, operations))}|{lang}|{config}|".encode())
+        digest.update(memoryview(image).cast('B'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached text for key, or None on a miss."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT text FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE ocr_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, text):
+        """Store text under key and evict the least recently used entries beyond max_bytes."""
+        if not self.enabled:
+            return
+        size = len(key) + len(text.encode('utf-8'))
+        with self._lock:
+            conn = self._connect()
+            # Take the write lock up front, so no other process changes the entry before it is replaced
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT size FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+                conn.execute("INSERT OR REPLACE INTO ocr_cache (key, text, size, last_access) VALUES (?, ?, ?, ?)",
+                             (key, text, size, time.time()))
+                total = self._add_bytes(conn, size - (row[0] if row else 0))
+                self._evict(conn, total)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @staticmethod
+    def _add_bytes(conn, delta):
+        """Add delta to the stored total size and return the new total."""
+        conn.execute("UPDATE ocr_cache_meta SET value = value + ? WHERE name = 'bytes'", (delta,))
+        return conn.execute("SELECT value FROM ocr_cache_meta WHERE name = 'bytes'").fetchone()[0]
+
+    def _evict(self, conn, total):
+        """Drop the oldest entries, EVICT_BATCH at a time, until the cache fits in max_bytes."""
+        while total > self.max_bytes:
+            freed = conn.execute("DELETE FROM ocr_cache WHERE key IN "
+                                 "(SELECT key FROM ocr_cache ORDER BY last_access LIMIT ?) RETURNING size",
+                                 (EVICT_BATCH,)).fetchall()
+            if not freed:
+                break
+            total = self._add_bytes(conn, -sum(size for size, in freed))
+
+    def invalidate(self, key=None):
+        """Remove one entry, or every entry when key is None."""
+        with self._lock:
+            conn = self._connect()
+            if key is None:
+                conn.execute("DELETE FROM ocr_cache")
+                conn.execute("UPDATE ocr_cache_meta SET value = 0 WHERE name = 'bytes'")
+            else:
+                freed = conn.execute("DELETE FROM ocr_cache WHERE key = ? RETURNING size", (key,)).fetchall()
+                self._add_bytes(conn, -sum(size for size, in freed))
+            conn.commit()
+
+    def stats(self):
+        """Return hit/miss counters and the current size of the cache."""
+        with self._lock:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM ocr_cache").fetchone()[0]
+            size = conn.execute("SELECT value FROM ocr_cache_meta WHERE name = 'bytes'").fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Return the process-wide cache, configured by RECEIPT_OCR_CACHE and RECEIPT_OCR_CACHE_MAX_BYTES."""
+    global _default_cache
+    if _default_cache is None:
+        path = os.environ.get('RECEIPT_OCR_CACHE', DEFAULT_CACHE_PATH)
+        max_bytes = int(os.environ.get('RECEIPT_OCR_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+        _default_cache = OCRCache(path, max_bytes=max_bytes)
+    return _default_cache
+
+
+def extract_text_cached(image, lang='eng', config=DEFAULT_CONFIG, operations=(), cache=None, bypass=False,
+                        extract=extract_text_from_image):
+    """Extract text from an image, reusing a cached result for the same pixels and pipeline.
+
+    With bypass=True Tesseract always runs and the fresh result replaces the cached one.
+    extract(image, lang=..., config=...) does the OCR on a miss, e.g.
+    line_segmentation.extract_text_by_lines with its LINE_CONFIG.
+    """
+    if cache is None:
+        cache = get_default_cache()
+
+    key = cache.make_key(image, operations, lang, config)
+    if not bypass:
+        text = cache.get(key)
+        if text is not None:
+            return text
+
+    text = extract(image, lang=lang, config=config)
+    cache.put(key, text)
+    return text
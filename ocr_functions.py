@@ -1,18 +1,286 @@
+import atexit
+import logging
+import os
+import queue
+import re
+import threading
+from concurrent.futures import Future
+
 import cv2
-import pytesseract
 
-def extract_text_from_image(image, lang='eng'):
+# tesserocr stays a module-level import: it installs signal handlers on import, which only works on the main
+# thread, and backends are created lazily from worker threads. pytesseract is imported by its backend.
+try:
+    import tesserocr
+except ImportError:  # tesserocr is optional; fall back to the pytesseract subprocess path
+    tesserocr = None
+
+# Configuration options for Tesseract
+DEFAULT_CONFIG = r'--oem 3 --psm 6'
+
+logger = logging.getLogger(__name__)
+
+
+def parse_tesseract_config(config):
+    """Split a Tesseract command-line config into (oem, psm, variables)."""
+    oem = re.search(r'--oem\s+(\d+)', config)
+    psm = re.search(r'--psm\s+(\d+)', config)
+    variables = dict(re.findall(r'-c\s+(\w+)=(\S+)', config))
+    return (int(oem.group(1)) if oem else 3), (int(psm.group(1)) if psm else 3), variables
+
+
+class PytesseractBackend:
+    """OCR backend that starts a new tesseract process for every image."""
+
+    name = 'pytesseract'
+
+    def __init__(self):
+        import pytesseract
+        self._pytesseract = pytesseract
+
+    def image_to_string(self, image, lang='eng', config=DEFAULT_CONFIG):
+        return self._pytesseract.image_to_string(image, config=config, lang=lang)
+
+    def image_to_string_with_confidence(self, image, lang='eng', config=DEFAULT_CONFIG):
+        """Return (text, mean word confidence from 0 to 100) from a single Tesseract run."""
+        pytesseract = self._pytesseract
+        data = pytesseract.image_to_data(image, config=config, lang=lang, output_type=pytesseract.Output.DICT)
+        return _text_from_data(data), _mean_confidence(data['conf'])
+
+    def close(self):
+        pass
+
+
+def _text_from_data(data):
+    """Rebuild page text from image_to_data words: one line per text line, a blank line between paragraphs."""
+    lines = []
+    words = []
+    current = None
+    for block, paragraph, line, text in zip(data['block_num'], data['par_num'], data['line_num'], data['text']):
+        if not text.strip():
+            continue
+        if (block, paragraph, line) != current:
+            if words:
+                lines.append(' '.join(words))
+                if current[:2] != (block, paragraph):
+                    lines.append('')
+            words = []
+            current = (block, paragraph, line)
+        words.append(text)
+    if words:
+        lines.append(' '.join(words))
+    return '\n'.join(lines) + '\n' if lines else ''
+
+
+def _mean_confidence(confidences):
+    """Average the word confidences, skipping the -1 Tesseract reports for non-word levels."""
+    values = [float(value) for value in confidences if float(value) >= 0]
+    return sum(values) / len(values) if values else 0.0
+
+
+class TesseractWorkerPool:
+    """OCR backend made of long-lived worker threads, each owning a loaded Tesseract engine.
+
+    The language model is loaded once per worker and images are handed over
+    in shared memory, so there is no process start-up, temp file or model
+    load per call. Tesseract releases the GIL while recognising, so the
+    workers run in parallel.
+    """
+
+    name = 'pool'
+
+    def __init__(self, workers=None, lang='eng', config=DEFAULT_CONFIG):
+        if tesserocr is None:
+            raise RuntimeError("TesseractWorkerPool requires the tesserocr package")
+        self._tasks = queue.Queue()
+        self._threads = []
+        ready = []
+        for _ in range(workers or os.cpu_count() or 1):
+            warm = Future()
+            thread = threading.Thread(target=self._worker, args=(lang, config, warm), daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            ready.append(warm)
+        # Surface model loading errors here rather than on the first image
+        try:
+            for warm in ready:
+                warm.result()
+        except Exception:
+            # Workers that did load an engine would otherwise wait for tasks forever
+            self.close()
+            raise
+
+    def _worker(self, lang, config, warm):
+        """Serve OCR requests, keeping one engine per (lang, oem) alive for the life of the thread."""
+        engines = {}
+
+        def get_engine(lang, oem):
+            if (lang, oem) not in engines:
+                engines[(lang, oem)] = tesserocr.PyTessBaseAPI(lang=lang, oem=oem)
+            return engines[(lang, oem)]
+
+        try:
+            get_engine(lang, parse_tesseract_config(config)[0])
+        except Exception as exc:
+            warm.set_exception(exc)
+            return
+        warm.set_result(None)
+
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                future, image, lang, config, with_confidence = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                previous = {}
+                try:
+                    oem, psm, variables = parse_tesseract_config(config)
+                    engine = get_engine(lang, oem)
+                    engine.SetPageSegMode(psm)
+                    for name, value in variables.items():
+                        previous.setdefault(name, engine.GetVariableAsString(name))
+                        engine.SetVariable(name, value)
+                    height, width = image.shape[:2]
+                    engine.SetImageBytes(image.tobytes(), width, height, 1, width)
+                    text = engine.GetUTF8Text()
+                    # The confidence comes from the recognition that just ran, at no extra cost
+                    future.set_result((text, float(engine.MeanTextConf())) if with_confidence else text)
+                except Exception as exc:
+                    future.set_exception(exc)
+                finally:
+                    # -c variables apply to one call, as with a tesseract process per image
+                    for name, value in previous.items():
+                        if value is not None:
+                            engine.SetVariable(name, value)
+        finally:
+            for engine in engines.values():
+                engine.End()
+
+    def submit(self, image, lang='eng', config=DEFAULT_CONFIG, with_confidence=False):
+        """Queue a grayscale image for OCR and return a Future for its text.
+
+        With with_confidence=True the Future's result is (text, mean confidence from 0 to 100).
+        """
+        future = Future()
+        self._tasks.put((future, image, lang, config, with_confidence))
+        return future
+
+    def image_to_string(self, image, lang='eng', config=DEFAULT_CONFIG):
+        return self.submit(image, lang, config).result()
+
+    def image_to_string_with_confidence(self, image, lang='eng', config=DEFAULT_CONFIG):
+        return self.submit(image, lang, config, with_confidence=True).result()
+
+    def close(self):
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+# Engines in the process-wide pool; None means one per CPU
+_default_workers = None
+
+
+def create_ocr_backend(name=None, **kwargs):
+    """Create an OCR backend by name: 'pool', 'pytesseract', or None for the best available."""
+    if name is None:
+        name = 'pool' if tesserocr is not None else 'pytesseract'
+    if name == 'pool':
+        return TesseractWorkerPool(**kwargs)
+    if name == 'pytesseract':
+        return PytesseractBackend()
+    raise ValueError(f"Unknown OCR backend: '{name}'")
+
+
+def get_ocr_backend():
+    """Return the process-wide OCR backend, selected by RECEIPT_OCR_BACKEND if set.
+
+    Without RECEIPT_OCR_BACKEND the pool is tried first and pytesseract is
+    used if its engines fail to start.
+    """
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is None:
+            name = os.environ.get('RECEIPT_OCR_BACKEND')
+            if name == 'pytesseract' or (name is None and tesserocr is None):
+                _default_backend = create_ocr_backend(name)
+            elif name is None:
+                try:
+                    _default_backend = create_ocr_backend('pool', workers=_default_workers)
+                except Exception as exc:
+                    # tesserocr is installed but cannot load a model, e.g. without tessdata
+                    logger.warning("Tesseract worker pool unavailable (%s); using pytesseract", exc)
+                    _default_backend = create_ocr_backend('pytesseract')
+            else:
+                _default_backend = create_ocr_backend(name, workers=_default_workers)
+        return _default_backend
+
+
+def set_ocr_workers(workers):
+    """Set the number of engines the process-wide pool is created with, e.g. 1 in each of N worker processes.
+
+    Without this every process loads one engine per CPU, so N processes
+    would hold N times that many copies of the language model.
+    """
+    global _default_workers
+    with _default_backend_lock:
+        _default_workers = workers
+
+
+def set_ocr_backend(backend):
+    """Replace the process-wide OCR backend, closing the previous one."""
+    global _default_backend
+    with _default_backend_lock:
+        if _default_backend is not None and _default_backend is not backend:
+            _default_backend.close()
+        _default_backend = backend
+
+
+def _reset_after_fork():
+    """Forget the parent's backend in a forked child, where its worker threads do not exist."""
+    global _default_backend, _default_backend_lock
+    # Another thread may have held the lock at the moment of the fork
+    _default_backend_lock = threading.Lock()
+    _default_backend = None
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+@atexit.register
+def _close_ocr_backend():
+    if _default_backend is not None:
+        _default_backend.close()
+
+
+def extract_text_from_image(image, lang='eng', config=DEFAULT_CONFIG, backend=None):
     """Extract text from a given image using Tesseract OCR."""
     # Convert the image to grayscale if it's not already
     if len(image.shape) == 3:
         image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
     # Use Tesseract to extract text
-    custom_config = r'--oem 3 --psm 6'  # Configuration options for Tesseract
-    text = pytesseract.image_to_string(image, config=custom_config, lang=lang)
+    if backend is None:
+        backend = get_ocr_backend()
+    text = backend.image_to_string(image, lang=lang, config=config)
 
     return text
 
+
+def extract_text_with_confidence(image, lang='eng', config=DEFAULT_CONFIG, backend=None):
+    """Extract text and Tesseract's mean word confidence (0 to 100) from an image."""
+    if len(image.shape) == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    if backend is None:
+        backend = get_ocr_backend()
+    return backend.image_to_string_with_confidence(image, lang=lang, config=config)
+
 def extract_text_from_receipts(transformed_receipts, lang='eng'):
     """Extract text from a list of transformed receipts."""
     for i, receipt in enumerate(transformed_receipts):
@@ -22,7 +290,7 @@ def extract_text_from_receipts(transformed_receipts, lang='eng'):
 
 
 if __name__ == "__main__":
-    transformed_receipts = [cv2.imread("images/Recept-I.png")]
+    transformed_receipts = [cv2.imread("img/Recept-I.png")]
 
     # Extract text from each receipt and print it to the terminal
     extract_text_from_receipts(transformed_receipts, lang='eng')
\ No newline at end of file
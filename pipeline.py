@@ -0,0 +1,257 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from autotune import AutoOperations, candidate_operations, race_operations, select_operations
+from preprocessing import compile_operations
+from profiling import stage
+from edge_detection import (
+    apply_clahe,
+    apply_adaptive_threshold,
+    apply_morphology,
+    find_receipt_contours,
+    combine_overlapping_rectangles,
+    combine_receipt_regions
+)
+from transformation import get_perspective_transform
+from large_scans import MIN_DETECTION_SIZE
+from line_segmentation import LINE_CONFIG, extract_text_by_lines
+from ocr_functions import extract_text_from_image
+from ocr_cache import extract_text_cached
+
+
+# A downscaled detection whose box covers this share of the frame merged the receipts; it is redone at full size
+WHOLE_FRAME = 0.9
+
+
+def detect_receipt_boxes(image, detection_scale=1.0, min_height=200, metrics=None, return_quads=False):
+    """Detect the bounding boxes of all receipts in the image, in full-resolution coordinates.
+
+    detection_scale < 1 detects on a 1/2, 1/4 or 1/8 grayscale pyramid level.
+    return_quads=True yields ((x, y, w, h), quad) pairs, quad being the
+    receipt's 4x2 float32 corners or None. metrics is a profiling.ImageMetrics.
+    """
+    reduction = 1
+    while reduction < 8 and 1 / (2 * reduction) >= detection_scale and \
+            max(image.shape[:2]) // (2 * reduction) >= MIN_DETECTION_SIZE:
+        reduction *= 2
+    detection_scale = 1 / reduction
+    if detection_scale >= 1.0:
+        small = image
+    else:
+        with stage(metrics, 'downscale', image):
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+            small = cv2.resize(gray, None, fx=detection_scale, fy=detection_scale, interpolation=cv2.INTER_AREA)
+
+    # Step 1: Enhance contrast and apply adaptive thresholding
+    with stage(metrics, 'clahe', small):
+        cl1 = apply_clahe(small)
+    with stage(metrics, 'adaptive_threshold', cl1):
+        binary_image = apply_adaptive_threshold(cl1)
+
+    # Step 2: Apply morphological operations
+    with stage(metrics, 'morphology', binary_image):
+        morphed_image = apply_morphology(binary_image)
+
+    # Step 3: Detect all contours that could be receipts, with a minimum height of 200 full-resolution pixels
+    contour_stats = {} if metrics is not None else None
+    with stage(metrics, 'find_receipt_contours', morphed_image):
+        bounding_boxes = find_receipt_contours(morphed_image, min_height=min_height * small.shape[0] / image.shape[0],
+                                               return_quads=return_quads, stats=contour_stats)
+
+    # Step 4: Combine overlapping rectangles
+    with stage(metrics, 'combine_rectangles'):
+        if return_quads:
+            regions = combine_receipt_regions(bounding_boxes)
+            combined_boxes = [box for box, _ in regions]
+        else:
+            combined_boxes = combine_overlapping_rectangles(bounding_boxes)
+
+    if small is not image and any(w * h >= WHOLE_FRAME * small.shape[0] * small.shape[1]
+                                  for _, _, w, h in combined_boxes):
+        if metrics is not None:
+            metrics.count('detection_fallbacks', 1)
+        return detect_receipt_boxes(image, min_height=min_height, metrics=metrics, return_quads=return_quads)
+
+    if metrics is not None:
+        metrics.count('contours', contour_stats.get('contours', 0))
+        metrics.count('contour_candidates', contour_stats.get('candidates', 0))
+        metrics.count('receipt_contours', len(bounding_boxes))
+        metrics.count('receipts', len(combined_boxes))
+
+    if small is not image:
+        combined_boxes = scale_boxes_to_image(combined_boxes, small.shape, image.shape)
+    if not return_quads:
+        return combined_boxes
+    quads = [scale_quad_to_image(quad, small.shape, image.shape) for _, quad in regions]
+    return list(zip(combined_boxes, quads))
+
+
+def scale_boxes_to_image(bounding_boxes, small_shape, full_shape):
+    """Map (x, y, w, h) boxes found on a downscaled image back onto the full-resolution image."""
+    scale_y = full_shape[0] / small_shape[0]
+    scale_x = full_shape[1] / small_shape[1]
+
+    scaled_boxes = []
+    for x, y, w, h in bounding_boxes:
+        # Round outwards so the full-resolution box never cuts into the receipt
+        x1 = int(x * scale_x)
+        y1 = int(y * scale_y)
+        x2 = min(math.ceil((x + w) * scale_x), full_shape[1])
+        y2 = min(math.ceil((y + h) * scale_y), full_shape[0])
+        scaled_boxes.append((x1, y1, x2 - x1, y2 - y1))
+    return scaled_boxes
+
+
+def scale_quad_to_image(quad, small_shape, full_shape):
+    """Map a receipt quad found on a downscaled image onto the full-resolution image, as float32."""
+    if quad is None:
+        return None
+    scale = np.array([full_shape[1] / small_shape[1], full_shape[0] / small_shape[0]], np.float32)
+    return quad.astype(np.float32) * scale
+
+
+def detect_scan_boxes(scan, min_height=200, metrics=None, return_quads=False):
+    """Detect receipts on a large_scans.ScanImage's reduced detection image, in full-resolution coordinates."""
+    small = scan.detection_image
+    regions = detect_receipt_boxes(small, min_height=min_height / scan.reduction, metrics=metrics,
+                                   return_quads=return_quads)
+    if not return_quads:
+        return scale_boxes_to_image(regions, small.shape, scan.shape)
+    boxes = scale_boxes_to_image([box for box, _ in regions], small.shape, scan.shape)
+    return [(box, scale_quad_to_image(quad, small.shape, scan.shape)) for box, (_, quad) in zip(boxes, regions)]
+
+
+def resolve_operations(image, operations, metrics=None):
+    """Return the operations to run on a warped receipt, choosing them from its statistics for 'auto'."""
+    if not isinstance(operations, AutoOperations):
+        return operations
+    with stage(metrics, 'autotune', image):
+        return select_operations(image)
+
+
+def apply_operations(image, operations, metrics=None):
+    """Execute the specified operations on the image in order, ending with a grayscale image.
+
+    The result lives in a per-thread buffer that the next call on the same thread reuses.
+    """
+    return compile_operations(tuple(operations)).run(image, metrics=metrics)
+
+
+def extract_receipt_text(image, operations, lang='eng', cache=None, line_ocr=False):
+    """OCR a preprocessed receipt, going through the OCR cache when one is given.
+
+    With line_ocr=True the receipt is cut into text lines that are OCRed
+    concurrently (see line_segmentation.extract_text_by_lines).
+    """
+    if line_ocr:
+        if cache is None:
+            return extract_text_by_lines(image, lang=lang)
+        return extract_text_cached(image, lang=lang, config=LINE_CONFIG, operations=operations, cache=cache,
+                                   extract=extract_text_by_lines)
+    if cache is None:
+        return extract_text_from_image(image, lang=lang)
+    return extract_text_cached(image, lang=lang, operations=operations, cache=cache)
+
+
+def recognize_receipt(receipt, operations, lang='eng', cache=None, timings=None, metrics=None, line_ocr=False):
+    """Preprocess and OCR a warped receipt.
+
+    operations may be an autotune.AutoOperations, in which case the chain is
+    chosen from the receipt's statistics or, with racing, by OCRing several
+    chains in parallel and keeping the most confident text (not cached, and
+    always read as one block). line_ocr is passed to extract_receipt_text.
+    If a timings dict is given, the seconds spent in each stage are stored in it.
+    """
+    start = time.perf_counter()
+    if isinstance(operations, AutoOperations) and operations.race:
+        with stage(metrics, 'autotune', receipt):
+            candidates = candidate_operations(receipt, operations.max_candidates)
+        preprocessed = time.perf_counter()
+        with stage(metrics, 'ocr', receipt):
+            _, text, _ = race_operations(receipt, candidates, lang=lang, time_budget=operations.time_budget)
+    else:
+        operations = resolve_operations(receipt, operations, metrics=metrics)
+        receipt = apply_operations(receipt, operations, metrics=metrics)
+        preprocessed = time.perf_counter()
+        with stage(metrics, 'ocr', receipt):
+            text = extract_receipt_text(receipt, operations, lang=lang, cache=cache, line_ocr=line_ocr)
+
+    if timings is not None:
+        timings['preprocess'] = preprocessed - start
+        timings['ocr'] = time.perf_counter() - preprocessed
+    return text
+
+
+def process_region(image, bounding_box, operations, lang='eng', cache=None, timings=None, metrics=None,
+                   line_ocr=False, quad=None):
+    """Warp, preprocess and OCR a single receipt region.
+
+    A skewed quad from detect_receipt_boxes(return_quads=True) is rectified;
+    otherwise the bounding box is sliced out without copying.
+    If a timings dict is given, the seconds spent in each stage are stored in it.
+    """
+    start = time.perf_counter()
+    with stage(metrics, 'warp'):
+        receipt = get_perspective_transform(image, bounding_box, quad)
+    if timings is not None:
+        timings['warp'] = time.perf_counter() - start
+    return recognize_receipt(receipt, operations, lang=lang, cache=cache, timings=timings, metrics=metrics,
+                             line_ocr=line_ocr)
+
+
+def process_receipt_regions(image, operations, lang='eng', max_workers=None, cache=None, detection_scale=1.0,
+                            metrics=None, line_ocr=False):
+    """Process every detected receipt in the image concurrently.
+
+    Returns a list of {'box': (x, y, w, h), 'text': str, 'timings': {stage: seconds}}
+    in detection order. The detection time is shared by all regions of the image.
+    """
+    start = time.perf_counter()
+    regions = detect_receipt_boxes(image, detection_scale=detection_scale, metrics=metrics, return_quads=True)
+    detect_time = time.perf_counter() - start
+    if not regions:
+        return []
+
+    def run(region):
+        box, quad = region
+        timings = {'detect': detect_time}
+        text = process_region(image, box, operations, lang, cache, timings=timings, metrics=metrics,
+                              line_ocr=line_ocr, quad=quad)
+        return {'box': tuple(box), 'text': text, 'timings': timings}
+
+    # Tesseract runs outside the GIL, so threads are enough to overlap the regions
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, regions))
+
+
+def process_scan_regions(scan, operations, lang='eng', max_workers=None, cache=None, metrics=None, line_ocr=False):
+    """Like process_receipt_regions, for a large_scans.ScanImage.
+
+    Detection runs on the scan's reduced copy. Only the receipt regions are
+    then cut from the full-resolution frame, which the scan releases before
+    preprocessing and OCR, so a worker never holds more than the frame and
+    its receipts at once. The time spent decoding the frame and cutting
+    the regions is shared by all regions as timings['load'].
+    """
+    start = time.perf_counter()
+    regions = detect_scan_boxes(scan, metrics=metrics, return_quads=True)
+    detect_time = time.perf_counter() - start
+    if not regions:
+        return []
+    with stage(metrics, 'load'):
+        crops = scan.crop_regions([box for box, _ in regions])
+    load_time = time.perf_counter() - start - detect_time
+
+    def run(region, crop):
+        (x, y, w, h), quad = region
+        timings = {'detect': detect_time, 'load': load_time}
+        text = process_region(crop, (0, 0, w, h), operations, lang, cache, timings=timings, metrics=metrics,
+                              line_ocr=line_ocr, quad=None if quad is None else quad - (x, y))
+        return {'box': (x, y, w, h), 'text': text, 'timings': timings}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(run, regions, crops))
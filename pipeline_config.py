@@ -0,0 +1,140 @@
+import fnmatch
+import json
+import os
+import re
+import threading
+
+import cv2
+import numpy as np
+
+from autotune import AutoOperations
+from preprocessing import compile_operations, validate_operation
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pipelines.json')
+
+# Used when there is no config file, and for images no rule matches
+DEFAULT_OPERATIONS = ('grayscale', 'binarization')
+
+# Every compiled chain is run once on this at load time
+_PROBE_IMAGE = np.full((16, 16, 3), 128, np.uint8)
+
+
+class PipelineRegistry:
+    """Preprocessing pipelines picked per image by rules, validated and compiled once at load.
+
+    Each rule has either a 'match' glob or a 'regex' and a list of
+    'operations'. A glob containing '/' is matched against the whole path and
+    any other glob against the file name only, so "Recept-I.png" matches
+    that file in any directory; a regex is searched for in the whole path.
+    The first matching rule wins; images no rule matches get the default
+    operations. Operations are names or {'op': name, param: value} dicts,
+    e.g. {"op": "binarization", "threshold_value": 120}. Instead of a list,
+    "auto" picks the chain per receipt from image statistics, and
+    {"auto": {"race": true, "max_candidates": 3, "time_budget": 2.0}} also
+    races candidate chains (see autotune.AutoOperations).
+    """
+
+    def __init__(self, rules=(), default=DEFAULT_OPERATIONS, source='<config>'):
+        self.source = source
+        self.rules = []
+        for index, rule in enumerate(rules):
+            where = f"{source}: rule {index + 1}"
+            if not isinstance(rule, dict) or ('match' in rule) == ('regex' in rule):
+                raise ValueError(f"{where}: needs exactly one of 'match' or 'regex'")
+            if 'operations' not in rule:
+                raise ValueError(f"{where}: missing 'operations'")
+
+            try:
+                if 'regex' in rule:
+                    matches, whole_path = re.compile(rule['regex']).search, True
+                else:
+                    matches, whole_path = re.compile(fnmatch.translate(rule['match'])).match, '/' in rule['match']
+            except (re.error, TypeError) as exc:
+                raise ValueError(f"{where}: invalid pattern: {exc}") from None
+            self.rules.append((matches, whole_path, self._compile(rule['operations'], where)))
+        self.set_default(default)
+
+    @staticmethod
+    def _compile(operations, where):
+        """Validate an operation list and compile it, returning its hashable form."""
+        if operations == 'auto' or isinstance(operations, AutoOperations):
+            return operations if isinstance(operations, AutoOperations) else AutoOperations()
+        if isinstance(operations, dict) and set(operations) == {'auto'}:
+            settings = {} if operations['auto'] is True else operations['auto']
+            try:
+                return AutoOperations(**settings)
+            except TypeError as exc:
+                raise ValueError(f"{where}: invalid 'auto' settings: {exc}") from None
+        if isinstance(operations, str) or not operations:
+            raise ValueError(f"{where}: 'operations' must be a non-empty list")
+        try:
+            operations = tuple(validate_operation(operation) for operation in operations)
+        except (ValueError, TypeError) as exc:
+            raise ValueError(f"{where}: {exc}") from None
+        # Warm the compiled pipeline cache so no image pays for compiling, and run it once on a tiny image so
+        # values OpenCV rejects, such as an even or negative kernel size, fail here rather than on every image
+        try:
+            compile_operations(operations).run(_PROBE_IMAGE, copy=True)
+        except (cv2.error, ValueError, TypeError) as exc:
+            raise ValueError(f"{where}: operations fail on a test image: {str(exc).strip()}") from None
+        return operations
+
+    @classmethod
+    def from_config(cls, config, source='<config>'):
+        """Build a registry from a parsed config: {'default': [...], 'rules': [...]}."""
+        if not isinstance(config, dict):
+            raise ValueError(f"{source}: expected an object with 'rules' and 'default'")
+        return cls(config.get('rules', ()), config.get('default', DEFAULT_OPERATIONS), source=source)
+
+    @classmethod
+    def load(cls, path):
+        """Load and compile a JSON config file."""
+        with open(path, encoding='utf-8') as file:
+            try:
+                config = json.load(file)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f"{path}: {exc}") from None
+        return cls.from_config(config, source=path)
+
+    def set_default(self, operations, where='default'):
+        """Validate, compile and use operations for images no rule matches."""
+        self.default = self._compile(operations, f"{self.source}: {where}")
+
+    def operations_for(self, image_path):
+        """Return the operations tuple for an image path."""
+        if image_path is not None:
+            path = image_path.replace(os.sep, '/')
+            name = path.rsplit('/', 1)[-1]
+            for matches, whole_path, operations in self.rules:
+                if matches(path if whole_path else name):
+                    return operations
+        return self.default
+
+
+_default_registry = None
+_default_registry_lock = threading.Lock()
+
+
+def get_default_registry():
+    """Return the process-wide registry, loaded from RECEIPT_PIPELINES or pipelines.json next to this module."""
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            path = os.environ.get('RECEIPT_PIPELINES', DEFAULT_CONFIG_PATH)
+            if os.path.exists(path) or 'RECEIPT_PIPELINES' in os.environ:
+                _default_registry = PipelineRegistry.load(path)
+            else:
+                _default_registry = PipelineRegistry()
+        return _default_registry
+
+
+def set_default_registry(registry):
+    """Replace the process-wide registry, e.g. with one loaded from a --pipelines file."""
+    global _default_registry
+    with _default_registry_lock:
+        _default_registry = registry
+
+
+def get_operations_for_image(image_path):
+    """Return the operations for an image from the process-wide registry."""
+    return get_default_registry().operations_for(image_path)
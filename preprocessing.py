@@ -0,0 +1,190 @@
+import inspect
+import threading
+from functools import lru_cache, partial
+
+import cv2
+import numpy as np
+
+from morphological_operations import get_kernel
+from profiling import stage
+from sharpening import SHARPEN_KERNEL
+
+
+def _grayscale(src, dst):
+    cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=dst)
+
+
+def _sharpening(src, dst):
+    cv2.filter2D(src, -1, SHARPEN_KERNEL, dst=dst)
+
+
+def _binarization(src, dst, threshold_value=150):
+    cv2.threshold(src, threshold_value, 255, cv2.THRESH_BINARY_INV, dst=dst)
+
+
+def _dilation(src, dst, kernel_size=(2, 2), iterations=1):
+    cv2.dilate(src, get_kernel(tuple(kernel_size)), dst=dst, iterations=iterations)
+
+
+def _erosion(src, dst, kernel_size=(2, 2), iterations=1):
+    cv2.erode(src, get_kernel(tuple(kernel_size)), dst=dst, iterations=iterations)
+
+
+def _clahe(src, dst, clip_limit=2.0, tile_grid_size=(8, 8)):
+    # CLAHE objects keep scratch state, so each call gets its own to stay thread-safe
+    cv2.createCLAHE(clipLimit=clip_limit, tileGridSize=tuple(tile_grid_size)).apply(src, dst=dst)
+
+
+# Operations that write into a caller-supplied output buffer
+FUSED_OPERATIONS = {
+    'grayscale': _grayscale,
+    'binarization': _binarization,
+    'dilation': _dilation,
+    'erosion': _erosion,
+    'sharpening': _sharpening,
+    'clahe': _clahe,
+}
+
+
+def _freeze(value):
+    """Turn lists from a config file into tuples so parameters stay hashable."""
+    return tuple(_freeze(item) for item in value) if isinstance(value, (list, tuple)) else value
+
+
+def normalize_operation(operation):
+    """Return the hashable form of an operation: its name, or (name, ((param, value), ...)).
+
+    Accepts a name, a {'op': name, param: value, ...} dict from a config file,
+    or a (name, params) pair where params is a dict or a tuple of pairs.
+    """
+    if isinstance(operation, str):
+        return operation
+    if isinstance(operation, dict):
+        params = {key: value for key, value in operation.items() if key != 'op'}
+        name = operation.get('op')
+    else:
+        name, params = operation
+        params = dict(params)
+    if not params:
+        return name
+    return name, tuple(sorted((key, _freeze(value)) for key, value in params.items()))
+
+
+def operation_name(operation):
+    """Return the name of a normalized operation."""
+    return operation if isinstance(operation, str) else operation[0]
+
+
+def operation_label(operation):
+    """Return a stable text form of an operation, e.g. 'binarization(threshold_value=120)'."""
+    operation = normalize_operation(operation)
+    if isinstance(operation, str):
+        return operation
+    name, params = operation
+    return f"{name}({', '.join(f'{key}={value!r}' for key, value in params)})"
+
+
+def validate_operation(operation):
+    """Normalize an operation and raise ValueError if its name or parameters are unknown."""
+    operation = normalize_operation(operation)
+    name = operation_name(operation)
+    if name not in FUSED_OPERATIONS:
+        raise ValueError(f"Unknown operation '{name}', expected one of {sorted(FUSED_OPERATIONS)}")
+    if not isinstance(operation, str):
+        parameters = dict(list(inspect.signature(FUSED_OPERATIONS[name]).parameters.items())[2:])
+        for key, value in operation[1]:
+            if key not in parameters:
+                raise ValueError(f"Unknown parameter '{key}' for operation '{name}', "
+                                 f"expected one of {list(parameters)}")
+            default = parameters[key].default
+            if not _matches_default(value, default):
+                raise ValueError(f"Invalid value {value!r} for parameter '{key}' of operation '{name}', "
+                                 f"expected a value like {default!r}")
+    return operation
+
+
+def _matches_default(value, default):
+    """Return True if a parameter value has the type of its default: a number, or a tuple of as many numbers."""
+    if isinstance(default, tuple):
+        return isinstance(value, tuple) and len(value) == len(default) and \
+            all(_matches_default(item, part) for item, part in zip(value, default))
+    if isinstance(value, bool):
+        return False
+    if isinstance(default, float):
+        return isinstance(value, (int, float))
+    return isinstance(value, int)
+
+
+class CompiledPipeline:
+    """An operation list compiled once and run over two reusable ping-pong buffers.
+
+    Each step reads the previous step's buffer and writes the other one
+    through OpenCV's dst= output, so a chain allocates nothing once the
+    buffers have grown to the largest image seen on the thread. The result
+    is a view into those buffers and stays valid until the next run on the
+    same thread; pass copy=True to keep it longer.
+    """
+
+    def __init__(self, operations, ensure_grayscale=False):
+        self.operations = []
+        self._steps = []
+        for operation in map(normalize_operation, operations):
+            name = operation_name(operation)
+            if name not in FUSED_OPERATIONS:
+                print(f"Warning: '{name}' is not a valid operation")
+                continue
+            # Consecutive grayscale conversions are no-ops after the first
+            if operation == 'grayscale' and self.operations and self.operations[-1] == 'grayscale':
+                continue
+            step = FUSED_OPERATIONS[name]
+            if not isinstance(operation, str):
+                step = partial(step, **dict(operation[1]))
+            self.operations.append(operation)
+            self._steps.append((name, step))
+
+        # Fold the conversion OCR would otherwise do on its own copy into the chain
+        if ensure_grayscale:
+            self._steps.append(('grayscale', _grayscale))
+        self._local = threading.local()
+
+    def _output_buffer(self, slot, shape, dtype):
+        """Return a contiguous view of the given ping-pong slot with the requested shape."""
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None:
+            buffers = self._local.buffers = [np.empty(0, np.uint8), np.empty(0, np.uint8)]
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if buffers[slot].nbytes < nbytes:
+            buffers[slot] = np.empty(nbytes, np.uint8)
+        return buffers[slot][:nbytes].view(dtype).reshape(shape)
+
+    def run(self, image, copy=False, metrics=None):
+        """Run the compiled operations on the image, timing each one into metrics if given."""
+        # Start on the slot the input does not live in, in case it is a previous result
+        buffers = getattr(self._local, 'buffers', None)
+        slot = 0 if buffers is not None and np.may_share_memory(image, buffers[0]) else 1
+        src = image
+        for operation, step in self._steps:
+            # Grayscale on an already-gray image is dropped
+            if operation == 'grayscale':
+                if src.ndim == 2:
+                    continue
+                shape = src.shape[:2]
+            else:
+                shape = src.shape
+            slot = 1 - slot
+            dst = self._output_buffer(slot, shape, src.dtype)
+            with stage(metrics, operation, src):
+                step(src, dst)
+            src = dst
+
+        if copy and src is not image:
+            return src.copy()
+        return src
+
+    __call__ = run
+
+
+@lru_cache(maxsize=None)
+def compile_operations(operations):
+    """Compile an operation tuple once into a reusable preprocessing pipeline for OCR."""
+    return CompiledPipeline(operations, ensure_grayscale=True)
@@ -0,0 +1,149 @@
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+# Returned by stage() when profiling is off, so disabled instrumentation costs one call
+_DISABLED = nullcontext()
+
+
+class ImageMetrics:
+    """Stage timings, image sizes, memory and counters collected for one image.
+
+    stages maps a stage name to a list of samples, one per time the stage ran
+    (e.g. once per receipt region), each a dict with 'seconds', 'shape' and,
+    when memory tracking is on, 'allocated' and 'peak' bytes. tracemalloc's
+    counters and peak are process-wide, so the memory numbers are only
+    right when one stage runs at a time: run regions on a single thread
+    (max_workers=1) when tracking memory.
+    """
+
+    def __init__(self, image_path, track_memory=False):
+        self.image_path = image_path
+        self.track_memory = track_memory
+        self.stages = {}
+        self.counts = {}
+        self.diagnostics = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, image=None):
+        """Time the enclosed block as one sample of the named stage."""
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sample = {'seconds': time.perf_counter() - start}
+            if image is not None:
+                sample['shape'] = tuple(image.shape)
+            if self.track_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                sample['allocated'] = current - start_memory
+                sample['peak'] = peak - start_memory
+            with self._lock:
+                self.stages.setdefault(name, []).append(sample)
+
+    def count(self, name, value):
+        """Add value to the named counter, e.g. the number of contours found."""
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def add_diagnostics(self, diagnostics):
+        """Record parse diagnostics (dicts with a 'code') and count each code."""
+        with self._lock:
+            self.diagnostics.extend(diagnostics)
+            for diagnostic in diagnostics:
+                self.counts[diagnostic['code']] = self.counts.get(diagnostic['code'], 0) + 1
+
+    def to_dict(self):
+        """Return the metrics as plain data for JSON output."""
+        return {'image': self.image_path, 'stages': self.stages, 'counts': self.counts,
+                'diagnostics': self.diagnostics}
+
+
+def stage(metrics, name, image=None):
+    """Return a timing context for the stage, or a no-op context when metrics is None."""
+    if metrics is None:
+        return _DISABLED
+    return metrics.stage(name, image)
+
+
+class Profiler:
+    """Collects ImageMetrics over a batch and summarizes them per stage.
+
+    With track_memory=True the pipeline must run its stages one at a time,
+    see ImageMetrics.
+    """
+
+    def __init__(self, enabled=True, track_memory=False):
+        self.enabled = enabled
+        self.track_memory = track_memory
+        self.images = []
+        self._lock = threading.Lock()
+        if enabled and track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def start_image(self, image_path):
+        """Return the ImageMetrics to pass down the pipeline for one image, or None when disabled."""
+        if not self.enabled:
+            return None
+        metrics = ImageMetrics(image_path, track_memory=self.track_memory)
+        with self._lock:
+            self.images.append(metrics)
+        return metrics
+
+    def summary(self, percentiles=(50, 95, 99)):
+        """Return {stage: {'count', 'total', 'p50', 'p95', 'p99', ...}} in seconds, over all images.
+
+        Each image contributes the summed time of all its samples of a stage.
+        With memory tracking, 'peak_bytes' is the largest peak seen for the stage.
+        """
+        per_stage = {}
+        peaks = {}
+        for metrics in self.images:
+            for name, samples in metrics.stages.items():
+                per_stage.setdefault(name, []).append(sum(sample['seconds'] for sample in samples))
+                for sample in samples:
+                    if 'peak' in sample:
+                        peaks[name] = max(peaks.get(name, 0), sample['peak'])
+
+        summary = {}
+        for name, values in per_stage.items():
+            values = np.asarray(values)
+            stats = {'count': len(values), 'total': float(values.sum())}
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                stats[f'p{percentile}'] = float(value)
+            if name in peaks:
+                stats['peak_bytes'] = peaks[name]
+            summary[name] = stats
+        return summary
+
+    def count_summary(self):
+        """Return {counter: {'total', 'mean', 'max'}} over all images."""
+        per_counter = {}
+        for metrics in self.images:
+            for name, value in metrics.counts.items():
+                per_counter.setdefault(name, []).append(value)
+        return {name: {'total': sum(values), 'mean': sum(values) / len(values), 'max': max(values)}
+                for name, values in per_counter.items()}
+
+    def report(self):
+        """Format the per-stage summary as a text table in milliseconds."""
+        lines = [f"{'stage':<24} {'images':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'total s':>9} {'peak MB':>9}"]
+        for name, stats in sorted(self.summary().items(), key=lambda item: -item[1]['total']):
+            peak = f"{stats['peak_bytes'] / 1e6:>9.1f}" if 'peak_bytes' in stats else f"{'-':>9}"
+            lines.append(f"{name:<24} {stats['count']:>7} {stats['p50'] * 1000:>9.2f} {stats['p95'] * 1000:>9.2f} "
+                         f"{stats['p99'] * 1000:>9.2f} {stats['total']:>9.2f} {peak}")
+
+        counters = self.count_summary()
+        if counters:
+            lines.append('')
+            lines.append(f"{'counter':<24} {'total':>9} {'mean':>9} {'max':>9}")
+            for name, stats in counters.items():
+                lines.append(f"{name:<24} {stats['total']:>9} {stats['mean']:>9.1f} {stats['max']:>9}")
+        return '\n'.join(lines)
@@ -0,0 +1,409 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+from autotune import AutoOperations
+from cli import iter_region_records, make_record
+from ocr_cache import get_default_cache
+from ocr_functions import extract_text_from_image, get_ocr_backend
+from pipeline import process_receipt_regions
+from pipeline_config import PipelineRegistry, get_default_registry, get_operations_for_image, set_default_registry
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+# Requests larger than this are refused before their body is read
+DEFAULT_MAX_BODY = 64 * 1024 * 1024
+# Seconds a request may take, queueing included, unless it asks for a deadline of its own
+DEFAULT_DEADLINE = 30.0
+# Requests queued and not yet started beyond which new ones are refused with 503
+DEFAULT_MAX_PENDING = 64
+# A batch is closed after this many requests or this many seconds after its first one
+DEFAULT_BATCH_SIZE = 8
+DEFAULT_BATCH_WINDOW = 0.005
+
+# Most header lines a request may send
+MAX_HEADERS = 100
+
+REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    411: 'Length Required',
+    413: 'Payload Too Large',
+    422: 'Unprocessable Entity',
+    500: 'Internal Server Error',
+    503: 'Service Unavailable',
+    504: 'Gateway Timeout',
+}
+
+
+class HttpError(Exception):
+    """An error answered with an HTTP status and a JSON {'error': message} body."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def process_image_bytes(data, name=None, cache=None, detection_scale=1.0, max_workers=None, line_ocr=False):
+    """Decode an encoded image and run the whole pipeline on it, returning one cli record per receipt.
+
+    name is only used to pick the preprocessing rule and as the records'
+    path. Raises ValueError if the bytes are not a decodable image.
+    """
+    start = time.perf_counter()
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode image")
+    decode_time = time.perf_counter() - start
+
+    operations = get_operations_for_image(name)
+    regions = process_receipt_regions(image, operations, lang='eng', max_workers=max_workers, cache=cache,
+                                      detection_scale=detection_scale, line_ocr=line_ocr)
+    if not regions:
+        return [make_record(name, error="No receipt detected", timings={'decode': decode_time})]
+    return list(iter_region_records(name, regions, decode_time))
+
+
+class _Job:
+    """One queued request: its payload, its deadline and the future its handler awaits."""
+
+    def __init__(self, data, name, line_ocr, deadline, future):
+        self.data = data
+        self.name = name
+        self.line_ocr = line_ocr
+        self.deadline = deadline
+        self.future = future
+        self.queued = time.monotonic()
+        # Identical uploads in one batch are processed once
+        self.key = (hashlib.sha256(data).digest(), name, line_ocr)
+
+
+class ReceiptService:
+    """Long-running receipt extraction service with warm OCR workers.
+
+    Requests are queued and collected into batches of up to batch_size,
+    closed batch_window seconds after their first request. Requests in a
+    batch whose deadline already passed are dropped without being run, and
+    identical uploads are run once. At most max_concurrency images are
+    processed at a time, each on a thread of the service's executor;
+    Tesseract releases the GIL, so they overlap. Past max_pending queued
+    requests new ones are refused, so a burst cannot grow the queue without
+    bound.
+    """
+
+    def __init__(self, max_concurrency=None, batch_size=DEFAULT_BATCH_SIZE, batch_window=DEFAULT_BATCH_WINDOW,
+                 max_pending=DEFAULT_MAX_PENDING, default_deadline=DEFAULT_DEADLINE, max_body=DEFAULT_MAX_BODY,
+                 cache=None, detection_scale=1.0, max_workers=None, line_ocr=False):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        self.max_pending = max_pending
+        self.default_deadline = default_deadline
+        self.max_body = max_body
+        self.cache = cache
+        self.detection_scale = detection_scale
+        self.max_workers = max_workers
+        self.line_ocr = line_ocr
+        self.stats = {'requests': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'expired': 0, 'batches': 0,
+                      'deduplicated': 0}
+        self.backend = None
+        self._queue = None
+        self._semaphore = None
+        self._executor = None
+        self._batcher = None
+        self._running = set()
+
+    def warm_up(self):
+        """Load the pipeline rules and the OCR backend and run one OCR, so the first request pays for neither."""
+        get_default_registry()
+        backend = get_ocr_backend()
+        blank = np.full((32, 128), 255, np.uint8)
+        extract_text_from_image(blank, backend=backend)
+        return backend.name
+
+    async def start(self):
+        """Start the executor and the batcher, and warm the workers up."""
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='receipt')
+        self.backend = await asyncio.get_running_loop().run_in_executor(self._executor, self.warm_up)
+        self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def close(self):
+        """Stop taking batches, wait for the images being processed and shut the executor down."""
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+
+    async def submit(self, data, name=None, line_ocr=None, deadline=None):
+        """Queue an encoded image and return its records, raising HttpError on overload or a missed deadline."""
+        self.stats['requests'] += 1
+        if self._queue.qsize() >= self.max_pending:
+            self.stats['rejected'] += 1
+            raise HttpError(503, "Too many pending requests")
+
+        timeout = self.default_deadline if deadline is None else deadline
+        job = _Job(data, name, self.line_ocr if line_ocr is None else line_ocr, time.monotonic() + timeout,
+                   asyncio.get_running_loop().create_future())
+        self._queue.put_nowait(job)
+        try:
+            # Shielded so a timeout here does not cancel a result shared with identical requests
+            return await asyncio.wait_for(asyncio.shield(job.future), timeout)
+        except asyncio.TimeoutError:
+            self.stats['expired'] += 1
+            raise HttpError(504, f"Deadline of {timeout:g} s exceeded") from None
+
+    async def _batch_loop(self):
+        """Collect queued jobs into batches and hand each distinct image to the executor."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            closes = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), max(0.0, closes - loop.time())))
+                except asyncio.TimeoutError:
+                    break
+            self.stats['batches'] += 1
+
+            groups = {}
+            now = time.monotonic()
+            for job in batch:
+                # Past its deadline the handler has already answered 504
+                if job.deadline > now and not job.future.done():
+                    groups.setdefault(job.key, []).append(job)
+            for jobs in groups.values():
+                self.stats['deduplicated'] += len(jobs) - 1
+                # Waiting here holds further batches back while every worker is busy
+                await self._semaphore.acquire()
+                task = asyncio.create_task(self._run(jobs))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+
+    async def _run(self, jobs):
+        """Process one image on the executor and resolve the futures of every job that sent it."""
+        first = jobs[0]
+        try:
+            if max(job.deadline for job in jobs) <= time.monotonic():
+                return
+            started = time.monotonic()
+            try:
+                records = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, lambda: process_image_bytes(first.data, first.name, self.cache,
+                                                                self.detection_scale, self.max_workers,
+                                                                first.line_ocr))
+            except ValueError as exc:
+                result = HttpError(422, str(exc))
+            except Exception as exc:
+                result = HttpError(500, f"{type(exc).__name__}: {exc}")
+            else:
+                result = {'name': first.name, 'receipts': records,
+                          'timings': {'process': time.monotonic() - started}}
+            finished = time.monotonic()
+            for job in jobs:
+                if job.future.done():
+                    continue
+                if job.deadline <= finished:
+                    # Its handler has answered 504 already
+                    job.future.cancel()
+                elif isinstance(result, HttpError):
+                    self.stats['failed'] += 1
+                    job.future.set_exception(result)
+                else:
+                    self.stats['completed'] += 1
+                    job.future.set_result({**result, 'timings': {'queue': started - job.queued,
+                                                                 **result['timings']}})
+        finally:
+            self._semaphore.release()
+
+    async def dispatch(self, method, target, body):
+        """Route one request, returning (status, JSON-serializable payload)."""
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if url.path == '/health':
+            if method != 'GET':
+                raise HttpError(405, "Use GET")
+            return 200, {'status': 'ok', 'backend': self.backend, 'pending': self._queue.qsize(),
+                         'running': len(self._running)}
+        if url.path == '/stats':
+            if method != 'GET':
+                raise HttpError(405, "Use GET")
+            return 200, dict(self.stats)
+        if url.path != '/receipts':
+            raise HttpError(404, f"No such path: {url.path}")
+        if method != 'POST':
+            raise HttpError(405, "POST the image bytes")
+        if not body:
+            raise HttpError(400, "Empty body; POST the encoded image")
+
+        name = query.get('name', [None])[0]
+        line_ocr = None
+        if 'line_ocr' in query:
+            line_ocr = query['line_ocr'][0].lower() in ('1', 'true', 'yes')
+        deadline = None
+        if 'deadline_ms' in query:
+            try:
+                deadline = float(query['deadline_ms'][0]) / 1000
+            except ValueError:
+                raise HttpError(400, "deadline_ms must be a number") from None
+            if deadline <= 0:
+                raise HttpError(400, "deadline_ms must be positive")
+        return 200, await self.submit(body, name, line_ocr, deadline)
+
+    async def handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one connection until the client closes it or asks to."""
+        try:
+            while True:
+                try:
+                    request = await read_request(reader, self.max_body)
+                except HttpError as exc:
+                    await write_response(writer, exc.status, {'error': exc.message}, keep_alive=False)
+                    break
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except HttpError as exc:
+                    status, payload = exc.status, {'error': exc.message}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await write_response(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def read_request(reader, max_body=DEFAULT_MAX_BODY):
+    """Read one HTTP/1.1 request, returning (method, target, headers, body) or None at end of stream.
+
+    Header names are lower-cased. Only bodies with a Content-Length are
+    accepted, up to max_body bytes.
+    """
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line") from None
+    if not version.startswith('HTTP/1.'):
+        raise HttpError(400, f"Unsupported protocol: {version}")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HttpError(400, "Too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'transfer-encoding' in headers:
+        raise HttpError(411, "Send a Content-Length instead of a chunked body")
+    try:
+        length = int(headers.get('content-length', 0))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length") from None
+    if length > max_body:
+        raise HttpError(413, f"Body over {max_body} bytes")
+    body = await reader.readexactly(length) if length > 0 else b''
+    return method.upper(), target, headers, body
+
+
+async def write_response(writer, status, payload, keep_alive=True):
+    """Write a JSON response."""
+    body = json.dumps(payload).encode()
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+    """Warm the service up and serve it over TCP or, with unix_path, a Unix socket until cancelled."""
+    await service.start()
+    if unix_path is not None:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_path)
+        where = unix_path
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving receipts on {where} with the {service.backend} backend, "
+          f"{service.max_concurrency} images at a time", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+        if unix_path is not None and os.path.exists(unix_path):
+            os.unlink(unix_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the receipt pipeline over a local HTTP API: POST image bytes "
+                                                 "to /receipts and get one JSON record per receipt back.")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--unix', default=None, metavar='PATH', help="listen on a Unix socket instead of TCP")
+    parser.add_argument('--concurrency', type=int, default=None, help="images processed at a time")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--batch-window', type=float, default=DEFAULT_BATCH_WINDOW * 1000, metavar='MS',
+                        help="how long a batch waits for more requests after its first")
+    parser.add_argument('--max-pending', type=int, default=DEFAULT_MAX_PENDING,
+                        help="queued requests beyond which new ones get 503")
+    parser.add_argument('--deadline', type=float, default=DEFAULT_DEADLINE, metavar='SECONDS',
+                        help="default per-request deadline; requests can pass ?deadline_ms=")
+    parser.add_argument('--max-body', type=float, default=DEFAULT_MAX_BODY / (1024 * 1024), metavar='MB')
+    parser.add_argument('--pipelines', default=None, help="JSON file of preprocessing pipeline rules")
+    parser.add_argument('--auto', action='store_true',
+                        help="choose preprocessing from image statistics for images no rule matches")
+    parser.add_argument('--detection-scale', type=float, default=1.0)
+    parser.add_argument('--line-ocr', action='store_true',
+                        help="OCR receipts line by line unless a request passes ?line_ocr=0")
+    parser.add_argument('--workers', type=int, default=None, help="threads per image for region OCR")
+    parser.add_argument('--cache', action='store_true', help="reuse OCR results from the on-disk cache")
+    args = parser.parse_args(argv)
+
+    if args.pipelines:
+        set_default_registry(PipelineRegistry.load(args.pipelines))
+    if args.auto:
+        get_default_registry().set_default(AutoOperations())
+
+    service = ReceiptService(max_concurrency=args.concurrency, batch_size=args.batch_size,
+                             batch_window=args.batch_window / 1000, max_pending=args.max_pending,
+                             default_deadline=args.deadline, max_body=int(args.max_body * 1024 * 1024),
+                             cache=get_default_cache() if args.cache else None,
+                             detection_scale=args.detection_scale, max_workers=args.workers,
+                             line_ocr=args.line_ocr)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,12 @@
 import cv2
 import numpy as np
 
+SHARPEN_KERNEL = np.array([[-1, -1, -1],
+                           [-1, 9, -1],
+                           [-1, -1, -1]])
+SHARPEN_KERNEL.setflags(write=False)
+
 
 def apply_sharpening(image):
     """Apply sharpening to the image."""
-    kernel = np.array([[-1, -1, -1],
-                       [-1, 9, -1],
-                       [-1, -1, -1]])
-    return cv2.filter2D(image, -1, kernel)
\ No newline at end of file
+    return cv2.filter2D(image, -1, SHARPEN_KERNEL)
\ No newline at end of file
@@ -0,0 +1,180 @@
+import argparse
+import os
+import re
+
+import cv2
+import numpy as np
+
+STORE_NAMES = ['RESTAURANT', 'BAKERY', 'COFFEE SHOP', 'ELECTRO SHOP', 'GROCERY MART', 'BOOK STORE']
+ITEM_NAMES = ['Chicken Curry', 'Fried Rice', 'Cheese Burger', 'Water', 'Ketchup', 'Soy Sauce', 'Coffee',
+              'Croissant', 'Shampoo', 'Soap', 'Pillow', 'Blanket', 'Napkins', 'Batteries', 'Notebook', 'Pencil']
+BACKGROUNDS = ('plain', 'noise', 'wood')
+
+FONT = cv2.FONT_HERSHEY_SIMPLEX
+
+# Lines ending in an amount are laid out in columns: name, optional qty, right-aligned amount
+AMOUNT_LINE = re.compile(r'^(.*?) (?:(\d+) )?(\d+\.\d{2})$')
+
+
+def make_receipt_lines(rng, item_count):
+    """Return (lines, total) for a receipt with random items and a known sub total."""
+    store = STORE_NAMES[rng.integers(len(STORE_NAMES))]
+    lines = [store, 'TAX INVOICE', 'CASH RECEIPT', 'Name Qty Total']
+
+    total = 0
+    for name in rng.choice(ITEM_NAMES, size=item_count, replace=False):
+        qty = int(rng.integers(1, 4))
+        cents = int(rng.integers(1, 40)) * 50 * qty
+        total += cents
+        lines.append(f"{name} {qty} {cents / 100:.2f}")
+
+    cash = (total // 1000 + 1) * 1000
+    lines.append(f"Sub Total {total / 100:.2f}")
+    lines.append(f"Cash {cash / 100:.2f}")
+    lines.append(f"Change {(cash - total) / 100:.2f}")
+    lines.append('Thank You!')
+    return lines, round(total / 100, 2)
+
+
+def render_receipt(lines, scale=1.0):
+    """Render receipt lines as black text on an off-white paper strip."""
+    font_scale = 0.6 * scale
+    thickness = max(1, int(round(1.5 * scale)))
+    line_height = int(round(22 * scale))
+    margin = int(round(20 * scale))
+    column_gap = int(round(30 * scale))
+
+    def text_width(text):
+        return cv2.getTextSize(text, FONT, font_scale, thickness)[0][0]
+
+    # Size the name, qty and amount columns from the widest entry in each
+    rows = [AMOUNT_LINE.match(line) for line in lines]
+    name_width = max(text_width(row.group(1) if row else line) for row, line in zip(rows, lines))
+    qty_width = max([text_width(row.group(2)) for row in rows if row and row.group(2)] or [0])
+    amount_width = max([text_width(row.group(3)) for row in rows if row] or [0])
+    qty_x = margin + name_width + column_gap
+    amount_right = qty_x + qty_width + column_gap + amount_width
+
+    width = amount_right + margin
+    height = line_height * len(lines) + 2 * margin
+
+    receipt = np.full((height, width, 3), 238, np.uint8)
+
+    def put(text, x, y):
+        cv2.putText(receipt, text, (x, y), FONT, font_scale, (0, 0, 0), thickness, cv2.LINE_AA)
+
+    for i, (row, line) in enumerate(zip(rows, lines)):
+        baseline = margin + line_height * (i + 1) - int(round(5 * scale))
+        if row is None:
+            put(line, margin, baseline)
+            continue
+        put(row.group(1), margin, baseline)
+        if row.group(2):
+            put(row.group(2), qty_x, baseline)
+        put(row.group(3), amount_right - text_width(row.group(3)), baseline)
+    return receipt
+
+
+def make_background(rng, shape, kind):
+    """Create a plain, noisy or wood-grain-like background for the scanner platen."""
+    height, width = shape
+    if kind == 'plain':
+        background = np.full((height, width, 3), 250, np.uint8)
+    elif kind == 'noise':
+        # Blotchy, spatially correlated noise like a dirty platen or lid
+        blotches = cv2.GaussianBlur(rng.normal(0, 1, (height, width)).astype(np.float32), (0, 0), 4)
+        gray = (245 + 40 * blotches).clip(0, 255).astype(np.uint8)
+        background = cv2.merge([gray, gray, gray])
+    elif kind == 'wood':
+        # Low-frequency streaks stretched along x plus fine grain
+        streaks = rng.normal(0, 1, (max(height // 8, 1), 4)).astype(np.float32)
+        streaks = cv2.resize(streaks, (width, height), interpolation=cv2.INTER_CUBIC)
+        grain = cv2.GaussianBlur(rng.normal(0, 1, (height, width)).astype(np.float32), (0, 0), 2)
+        gray = (200 + 15 * streaks + 10 * grain).clip(0, 255).astype(np.uint8)
+        background = cv2.merge([(gray * 0.8).astype(np.uint8), (gray * 0.9).astype(np.uint8), gray])
+    else:
+        raise ValueError(f"Unknown background: '{kind}'")
+    return background
+
+
+def rotate_receipt(receipt, angle):
+    """Rotate a receipt about its centre, returning the rotated image and its paper mask."""
+    height, width = receipt.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    new_width = int(np.ceil(height * sin + width * cos))
+    new_height = int(np.ceil(height * cos + width * sin))
+    matrix[0, 2] += new_width / 2 - width / 2
+    matrix[1, 2] += new_height / 2 - height / 2
+
+    rotated = cv2.warpAffine(receipt, matrix, (new_width, new_height), borderValue=(0, 0, 0))
+    mask = cv2.warpAffine(np.full((height, width), 255, np.uint8), matrix, (new_width, new_height))
+    return rotated, mask
+
+
+def render_sheet(seed=0, receipts=3, scale=1.0, max_rotation=0.0, noise=0.0, background='plain'):
+    """Render a platen scan with several receipts and return (image, ground_truth).
+
+    ground_truth is a list of {'box': (x, y, w, h), 'lines': [...], 'text': str,
+    'total': float} in left-to-right order.
+    """
+    rng = np.random.default_rng(seed)
+
+    rendered = []
+    for _ in range(receipts):
+        lines, total = make_receipt_lines(rng, int(rng.integers(3, 8)))
+        receipt = render_receipt(lines, scale)
+        angle = float(rng.uniform(-max_rotation, max_rotation)) if max_rotation else 0.0
+        receipt, mask = rotate_receipt(receipt, angle)
+        rendered.append((receipt, mask, lines, total))
+
+    # Lay the receipts out left to right with a gap, like receipts on a scanner
+    gap = int(round(60 * scale))
+    sheet_height = max(receipt.shape[0] for receipt, _, _, _ in rendered) + 2 * gap
+    sheet_width = sum(receipt.shape[1] for receipt, _, _, _ in rendered) + gap * (receipts + 1)
+    sheet = make_background(rng, (sheet_height, sheet_width), background)
+
+    ground_truth = []
+    x = gap
+    for receipt, mask, lines, total in rendered:
+        height, width = receipt.shape[:2]
+        y = gap + int(rng.integers(0, sheet_height - 2 * gap - height + 1))
+        # Soft drop shadow just past the paper edge, which is what outlines the receipt for detection
+        pad = int(round(6 * scale))
+        surround = sheet[y - pad:y + height + pad, x - pad:x + width + pad]
+        shadow = cv2.GaussianBlur(cv2.copyMakeBorder(mask, pad, pad, pad, pad, cv2.BORDER_CONSTANT),
+                                  (0, 0), 2 * scale).astype(np.float32) / 255
+        surround[:] = (surround * (1 - 0.5 * shadow[:, :, None])).astype(np.uint8)
+        np.copyto(sheet[y:y + height, x:x + width], receipt, where=mask[:, :, None] > 0)
+        ground_truth.append({'box': (x, y, width, height), 'lines': lines, 'text': '\n'.join(lines),
+                             'total': total})
+        x += width + gap
+
+    if noise:
+        sheet = (sheet + rng.normal(0, noise, sheet.shape)).clip(0, 255).astype(np.uint8)
+    return sheet, ground_truth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic receipt sheets with known text and totals.")
+    parser.add_argument('output_dir')
+    parser.add_argument('--count', type=int, default=10)
+    parser.add_argument('--receipts', type=int, default=3, help="receipts per sheet")
+    parser.add_argument('--scale', type=float, default=1.0, help="resolution multiplier")
+    parser.add_argument('--rotation', type=float, default=0.0, help="maximum rotation in degrees")
+    parser.add_argument('--noise', type=float, default=0.0, help="Gaussian noise sigma")
+    parser.add_argument('--background', choices=BACKGROUNDS, default='plain')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    for i in range(args.count):
+        sheet, ground_truth = render_sheet(args.seed + i, args.receipts, args.scale, args.rotation, args.noise,
+                                           args.background)
+        path = os.path.join(args.output_dir, f"sheet-{i:04d}.png")
+        cv2.imwrite(path, sheet)
+        print(f"{path}: totals {[receipt['total'] for receipt in ground_truth]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+import batch_processing
+from batch_processing import iter_process_receipts
+
+
+def fake_process_receipt(image_path, **kwargs):
+    """Stand-in for data_visualization.process_receipt that kills its worker process for paths named 'crash'."""
+    if image_path.startswith('crash'):
+        os._exit(1)
+    if image_path == 'error':
+        raise ValueError("unreadable")
+    return float(len(image_path))
+
+
+@pytest.fixture(autouse=True)
+def fake_receipts(monkeypatch):
+    # Worker processes are forked, so they see the patched function
+    monkeypatch.setattr(batch_processing, 'process_receipt', fake_process_receipt)
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_crashed_worker_fails_only_its_image(max_workers):
+    paths = ['a', 'bb', 'crash', 'ccc', 'error', 'dddd', 'eeeee', 'ffffff']
+    results = list(iter_process_receipts(paths, max_workers=max_workers))
+
+    assert [path for path, _, _ in results] == paths
+    for path, total, error in results:
+        if path == 'crash':
+            assert total == 0.0 and error.startswith('BrokenProcessPool')
+        elif path == 'error':
+            assert error == "ValueError: unreadable"
+        else:
+            assert (total, error) == (float(len(path)), None)
+
+
+def test_several_crashes_unordered():
+    paths = ['crash-1', 'a', 'crash-2', 'bb', 'ccc', 'crash-3']
+    results = {path: (total, error) for path, total, error in
+               iter_process_receipts(paths, max_workers=2, max_in_flight=4, ordered=False)}
+
+    assert set(results) == set(paths)
+    assert sorted(path for path, (_, error) in results.items() if error) == ['crash-1', 'crash-2', 'crash-3']
+    assert results['a'] == (1.0, None) and results['bb'] == (2.0, None) and results['ccc'] == (3.0, None)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import edge_detection
+from edge_detection import combine_overlapping_rectangles
+
+
+def overlaps(a, b):
+    """Return True if two (x, y, w, h) boxes share interior area; touching edges do not count."""
+    return a[0] < b[0] + b[2] and b[0] < a[0] + a[2] and a[1] < b[1] + b[3] and b[1] < a[1] + a[3]
+
+
+def combine_brute_force(boxes):
+    """Merge any overlapping pair until none is left, sorted like combine_overlapping_rectangles."""
+    boxes = [tuple(box) for box in boxes]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if overlaps(boxes[i], boxes[j]):
+                    a, b = boxes[i], boxes[j]
+                    x1, y1 = min(a[0], b[0]), min(a[1], b[1])
+                    x2, y2 = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+                    boxes[i] = (x1, y1, x2 - x1, y2 - y1)
+                    del boxes[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return sorted(boxes)
+
+
+def test_empty():
+    assert combine_overlapping_rectangles([]) == []
+
+
+def test_transitive_chain_merges_into_one_box():
+    # a overlaps b and b overlaps c, but a and c are apart
+    boxes = [(0, 0, 10, 10), (8, 0, 10, 10), (16, 0, 10, 10)]
+    assert combine_overlapping_rectangles(boxes) == [(0, 0, 26, 10)]
+
+
+def test_chain_along_y_merges():
+    boxes = [(0, 20, 10, 10), (0, 0, 10, 12), (2, 10, 5, 12)]
+    assert combine_overlapping_rectangles(boxes) == [(0, 0, 10, 30)]
+
+
+def test_merged_box_absorbs_boxes_it_grew_into():
+    # Neither small box overlaps the other, but their merge reaches the third box
+    boxes = [(0, 0, 10, 10), (5, 5, 10, 10), (12, 0, 4, 3)]
+    assert combine_overlapping_rectangles(boxes) == [(0, 0, 16, 15)]
+
+
+def test_touching_boxes_stay_apart():
+    boxes = [(0, 0, 10, 10), (10, 0, 10, 10), (0, 10, 10, 10)]
+    assert combine_overlapping_rectangles(boxes) == [(0, 0, 10, 10), (0, 10, 10, 10), (10, 0, 10, 10)]
+
+
+def test_zero_area_box():
+    # Alone it is kept as it is; inside another box it is absorbed
+    assert combine_overlapping_rectangles([(5, 5, 0, 0), (20, 20, 4, 4)]) == [(5, 5, 0, 0), (20, 20, 4, 4)]
+    assert combine_overlapping_rectangles([(5, 5, 0, 0), (0, 0, 10, 10)]) == [(0, 0, 10, 10)]
+
+
+def test_result_is_sorted_by_x_then_y():
+    boxes = [(50, 0, 5, 5), (0, 40, 5, 5), (0, 10, 5, 5), (20, 0, 5, 5)]
+    assert combine_overlapping_rectangles(boxes) == [(0, 10, 5, 5), (0, 40, 5, 5), (20, 0, 5, 5), (50, 0, 5, 5)]
+    assert combine_overlapping_rectangles(boxes[::-1]) == combine_overlapping_rectangles(boxes)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    count = int(rng.integers(1, 60))
+    boxes = np.column_stack((rng.integers(0, 200, count), rng.integers(0, 200, count),
+                             rng.integers(0, 40, count), rng.integers(0, 40, count))).tolist()
+    assert combine_overlapping_rectangles(boxes) == combine_brute_force(boxes)
+
+
+def test_matches_brute_force_across_sweep_chunks(monkeypatch):
+    # Wide, short boxes give long sweep windows, which are split over many chunks
+    monkeypatch.setattr(edge_detection, 'SWEEP_CHUNK_PAIRS', 7)
+    rng = np.random.default_rng(0)
+    boxes = [(int(x), int(y), int(w), 2) for x, y, w in
+             zip(rng.integers(0, 100, 80), rng.integers(0, 300, 80), rng.integers(50, 200, 80))]
+    assert combine_overlapping_rectangles(boxes) == combine_brute_force(boxes)
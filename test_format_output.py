@@ -0,0 +1,34 @@
+from format_output import parse_receipt
+
+
+def codes(receipt):
+    return [diagnostic['code'] for diagnostic in receipt['diagnostics']]
+
+
+def test_lines_after_the_subtotal_are_not_items():
+    receipt = parse_receipt("Coffee 1 2.50\nTea 1 3.00\nSub Total 5.50\nTax 0.50\nTotal 6.00\n"
+                            "Cash 10.00\nChange 4.00\nDate 12/03/2024")
+
+    assert receipt['items'] == [{'name': 'Coffee', 'qty': 1, 'price': 2.5}, {'name': 'Tea', 'qty': 1, 'price': 3.0}]
+    assert (receipt['subtotal'], receipt['total'], receipt['amount']) == (5.5, 6.0, 5.5)
+    assert receipt['date'] == '2024-03-12'
+    assert receipt['confidence'] == 1.0 and receipt['diagnostics'] == []
+
+
+def test_total_label_with_its_price_on_the_next_line():
+    # The heading break puts the price on the line after its label
+    receipt = parse_receipt("Coffee 1 2.50 Tea 1 3.00 Total Tel: 5.50")
+
+    assert [item['name'] for item in receipt['items']] == ['Coffee', 'Tea']
+    assert (receipt['subtotal'], receipt['total'], receipt['amount']) == (None, 5.5, 5.5)
+    assert receipt['confidence'] == 0.9
+    assert codes(receipt) == ['split_total']
+
+
+def test_no_total_found():
+    receipt = parse_receipt("Coffee 1 2.50\nTea 1 3.00")
+
+    assert len(receipt['items']) == 2
+    assert receipt['amount'] is None and receipt['total'] is None and receipt['subtotal'] is None
+    assert receipt['confidence'] == 0.0
+    assert codes(receipt) == ['no_total']
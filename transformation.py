@@ -1,27 +1,64 @@
 import cv2
 import numpy as np
-from edge_detection import (
-    apply_clahe,
-    apply_adaptive_threshold,
-    apply_morphology,
-    find_receipt_contours,
-    combine_overlapping_rectangles
-)
 
 
-def get_perspective_transform(image, bounding_box):
-    """Apply perspective transformation to get a top-down view of the receipt."""
-    x, y, w, h = bounding_box
+# Quads whose edges are all within this many degrees of the axes are sliced out rather than warped; Tesseract
+# copes with that much skew, and the outline of a straight receipt can be this far off
+MAX_AXIS_ANGLE = 2.0
+# Share of a rectified receipt's width and height cut from each side. The detected outline includes the paper
+# edge and its shadow, which the warp turns into jagged lines that Tesseract reads as characters.
+QUAD_INSET = 0.02
+
+
+def order_quad(quad):
+    """Return the four corners of a quad as float32 top-left, top-right, bottom-right, bottom-left."""
+    quad = np.asarray(quad, dtype=np.float32).reshape(4, 2)
+    sums = quad.sum(axis=1)
+    diffs = quad[:, 1] - quad[:, 0]
+    return quad[[np.argmin(sums), np.argmin(diffs), np.argmax(sums), np.argmax(diffs)]]
+
 
-    # Create a contour from the bounding box
-    rect_points = np.array([[x, y], [x + w, y], [x + w, y + h], [x, y + h]], dtype="float32")
+def quad_skew(quad):
+    """Return the largest angle in degrees between an edge of the quad and the axis it runs along."""
+    corners = order_quad(quad)
+    edges = np.roll(corners, -1, axis=0) - corners
+    # Top and bottom edges run along x, the left and right edges along y
+    along = np.abs(edges[[0, 2], 0]).tolist() + np.abs(edges[[1, 3], 1]).tolist()
+    across = np.abs(edges[[0, 2], 1]).tolist() + np.abs(edges[[1, 3], 0]).tolist()
+    return float(max(np.degrees(np.arctan2(off, on)) for on, off in zip(along, across)))
 
-    # Define the destination points for the top-down view
-    dst = np.array([[0, 0], [w - 1, 0], [w - 1, h - 1], [0, h - 1]], dtype="float32")
+
+def get_perspective_transform(image, bounding_box, quad=None):
+    """Apply perspective transformation to get a top-down view of the receipt.
+
+    A skewed quad (the receipt's four corners) is rectified to a receipt as
+    wide and tall as its longest edges, less QUAD_INSET on every side.
+    Without a quad, or when no edge of the quad is more than MAX_AXIS_ANGLE
+    off the axes, the bounding box is returned as a view into image: no
+    pixels are copied or resampled.
+    """
+    x, y, w, h = bounding_box
+    if quad is None or quad_skew(quad) <= MAX_AXIS_ANGLE:
+        return image[y:y + h, x:x + w]
+
+    rect_points = order_quad(quad)
+    if len(np.unique(rect_points, axis=0)) < 4:
+        # Corners that collapse onto each other give no usable transform
+        return image[y:y + h, x:x + w]
+    top_left, top_right, bottom_right, bottom_left = rect_points
+    width = int(round(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left)))) + 1
+    height = int(round(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right)))) + 1
+
+    # Define the destination points for the top-down view, shifted so the inset falls outside the output
+    inset_x = int(round(QUAD_INSET * width))
+    inset_y = int(round(QUAD_INSET * height))
+    dst = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype="float32")
+    dst -= (inset_x, inset_y)
 
     # Compute the perspective transform matrix and apply it
     M = cv2.getPerspectiveTransform(rect_points, dst)
-    warped = cv2.warpPerspective(image, M, (w, h))
+    warped = cv2.warpPerspective(image, M, (width - 2 * inset_x, height - 2 * inset_y),
+                                 borderMode=cv2.BORDER_REPLICATE)
 
     return warped
 
@@ -47,7 +84,16 @@ def draw_transformed_receipts(image, bounding_boxes):
 
 
 def main():
-    image_path = 'images/Recepts.png'
+    # Only this demo runs detection; the pipeline passes boxes and quads in
+    from edge_detection import (
+        apply_clahe,
+        apply_adaptive_threshold,
+        apply_morphology,
+        find_receipt_contours,
+        combine_overlapping_rectangles
+    )
+
+    image_path = 'img/Recepts.png'
     image = cv2.imread(image_path)
     if image is None:
         print("Image not found.")